@@ -0,0 +1,260 @@
+# Offline benchmark of the parsing and export stages against committed session caches
+# Reports documents/sec, p50/p95 per-document latency and peak RSS per stage, saved as JSON
+# Run as `python3 benchmark.py` (all sessions and stages), or e.g.
+#   python3 benchmark.py --sessions 20231 --stages bill-page floor-vote --limit 200
+#   python3 benchmark.py --compare benchmark-baseline.json --output benchmark-results.json
+# With --compare, exits with status 1 if any stage regressed by more than --threshold
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
+from os.path import exists, join
+
+from config import PARSER_BACKEND
+
+from cache_store import get_cache_store
+from functions import make_bill_key, read_json
+from instrumentation import percentile
+from models.bill import Bill
+from models.bill_list import BillList
+from models.vote import Vote, extract_pdf_text
+
+SESSIONS = ['20231', '20211']
+STAGES = ['bill-list', 'bill-page', 'floor-vote', 'committee-vote', 'export']
+
+# Runs of the whole-list parse, since it's a single document
+BILL_LIST_REPEATS = 5
+
+
+def timed(documents, parse):
+    """
+    Runs parse over each document, returning per-document latencies and a count of parse errors
+    """
+    latencies = []
+    errors = 0
+    for document in documents:
+        start = time.perf_counter()
+        try:
+            parse(document)
+        except Exception:
+            errors += 1
+        latencies.append(time.perf_counter() - start)
+    return latencies, errors
+
+
+def cached_documents(session, directory, suffix, limit, keep=lambda key: True):
+    # Read lazily so file reads stay out of the timings
+    store = get_cache_store(join('cache', session))
+    keys = [key for key in store.keys(directory, suffix) if keep(key)][:limit]
+    for key in keys:
+        yield store.read(key)
+
+
+def bench_bill_list(session, backend, limit):
+    with open(join('cache', session, 'all-introduced-bills.html')) as f:
+        text = f.read()
+    parser = BillList.__new__(BillList)
+    parse = parser.parse_bill_list_html_lxml if backend == 'lxml' else parser.parse_bill_list_html
+    # parse_bill_row logs as it goes, which isn't what's being measured
+    with contextlib.redirect_stdout(io.StringIO()):
+        return timed([text] * BILL_LIST_REPEATS, parse)
+
+
+def bench_bill_page(session, backend, limit):
+    parse = Bill.parse_bill_html_lxml if backend == 'lxml' else Bill.parse_bill_html
+    # Bill pages are cached as e.g. 'HB 12.html', the 2021 cache also has some stray vote pages in bills/
+    documents = cached_documents(session, 'bills', '.html', limit, lambda key: ' ' in key)
+    return timed((raw.decode('utf-8') for raw in documents), parse)
+
+
+def bench_floor_vote(session, backend, limit):
+    parse = Vote.parse_floor_vote_html_lxml if backend == 'lxml' else Vote.parse_floor_vote_html
+    texts = (raw.decode('utf-8') for raw in cached_documents(session, 'votes', '.html', limit))
+    return timed((text for text in texts if "No Vote Records Found for this Action." not in text), parse)
+
+
+def bench_committee_vote(session, backend, limit):
+    # Full cost of a PDF the parse cache and text sidecars haven't seen
+    return timed(cached_documents(session, 'votes', '.pdf', limit),
+                 lambda raw: Vote.parse_committee_vote_text(extract_pdf_text(raw)))
+
+
+class ExportedBill:
+    """
+    Stands in for a scraped Bill in BillList.export, serving its last exported output
+
+    Calls to export() mark where each bill's turn starts, see bench_export
+    """
+
+    def __init__(self, bill_data, actions, votes, marks):
+        self.key = bill_data['key']
+        self.urlKey = make_bill_key(self.key)
+        self.bill_data = bill_data
+        self.actions = actions
+        self.votes = votes
+        self.marks = marks
+
+    def export(self):
+        self.marks.append(time.perf_counter())
+        return self.bill_data
+
+    def export_actions(self):
+        return self.actions
+
+    def export_votes(self):
+        return self.votes
+
+
+def bench_export(session, backend, limit):
+    session_output_path = join('output', session)
+    marks = []
+    bills = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for bill_data in read_json(join(session_output_path, 'all-bills.json'))[:limit]:
+            url_key = make_bill_key(bill_data['key'])
+            bills.append(ExportedBill(
+                bill_data,
+                read_json(join(session_output_path, f'{url_key}--actions.json')),
+                read_json(join(session_output_path, f'{url_key}--votes.json')),
+                marks))
+
+    bill_list = BillList.__new__(BillList)
+    bill_list.bills = bills
+    with tempfile.TemporaryDirectory() as output_base_path, contextlib.redirect_stdout(io.StringIO()):
+        bill_list.export(output_base_path=output_base_path, run_report_path=None, names_report_path=None)
+        marks.append(time.perf_counter())
+    # Each bill's latency runs from its export() call to the next one, or to the end of the export
+    return [end - start for start, end in zip(marks, marks[1:])], 0
+
+
+STAGE_FUNCTIONS = {
+    'bill-list': bench_bill_list,
+    'bill-page': bench_bill_page,
+    'floor-vote': bench_floor_vote,
+    'committee-vote': bench_committee_vote,
+    'export': bench_export,
+}
+
+
+def run_stage(stage, session, backend, limit):
+    """
+    Runs one stage in the current process, meant to be a fresh worker so peak RSS is the stage's own
+    """
+    start = time.perf_counter()
+    latencies, errors = STAGE_FUNCTIONS[stage](session, backend, limit)
+    seconds = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss_mb = peak_rss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    parse_seconds = sum(latencies)
+    ordered = sorted(latencies)
+    return {
+        'documents': len(latencies),
+        'errors': errors,
+        'seconds': round(seconds, 3),
+        'docsPerSec': round(len(latencies) / parse_seconds, 2) if parse_seconds else None,
+        'p50Ms': round(percentile(ordered, 0.5) * 1000, 3) if ordered else None,
+        'p95Ms': round(percentile(ordered, 0.95) * 1000, 3) if ordered else None,
+        'peakRssMb': round(peak_rss_mb, 1),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """
+    Returns regressions of more than `threshold` (a fraction) in throughput, p95 latency or peak RSS
+    """
+    regressions = []
+    checks = [('docsPerSec', -1), ('p95Ms', 1), ('peakRssMb', 1)]
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for metric, direction in checks:
+            before, after = previous.get(metric), result.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            if change * direction > threshold:
+                regressions.append(f'{name} {metric}: {before} -> {after} ({change:+.0%})')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline parse/export benchmark over cached sessions')
+    parser.add_argument('--sessions', nargs='+', default=SESSIONS)
+    parser.add_argument('--stages', nargs='+', default=STAGES, choices=STAGES)
+    parser.add_argument('--backend', default=PARSER_BACKEND, choices=['bs4', 'lxml'])
+    parser.add_argument('--limit', type=int, default=None,
+                        help='max documents per stage, for quick runs')
+    parser.add_argument('--output', default='benchmark-results.json')
+    parser.add_argument('--compare', default=None,
+                        help='earlier results file to flag regressions against')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='regression threshold as a fraction, default 0.1')
+    args = parser.parse_args()
+
+    results = {}
+    for session in args.sessions:
+        if not exists(join('cache', session)):
+            print(f'Skipping {session}, no cache')
+            continue
+        for stage in args.stages:
+            # Fresh process per stage, so one stage's memory doesn't show up in the next one's peak RSS
+            with ProcessPoolExecutor(1, mp_context=get_context('spawn')) as pool:
+                result = pool.submit(run_stage, stage, session,
+                                     args.backend, args.limit).result()
+            name = f'{session}/{stage}'
+            results[name] = result
+            print(f"{name:<24} {result['documents']:>6} docs  {result['docsPerSec'] or 0:>9.1f}/s  "
+                  f"p50 {result['p50Ms'] or 0:>8.2f}ms  p95 {result['p95Ms'] or 0:>8.2f}ms  "
+                  f"peak RSS {result['peakRssMb']:>7.1f}MB  errors {result['errors']}")
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'backend': args.backend,
+            'limit': args.limit,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=4)
+    print('Written to', args.output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline['results'], args.threshold)
+        print(f"\nCompared to {args.compare} ({baseline['meta'].get('commit')}):")
+        for regression in regressions:
+            print('- REGRESSION', regression)
+        if not regressions:
+            print('- No regressions')
+        else:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+import hashlib
+import os
+import sqlite3
+import zlib
+from glob import glob
+from os.path import dirname, exists, join, relpath
+from threading import Lock
+
+from config import CACHE_STORE_BACKEND
+
+# Packed store file, e.g. cache/20231/cache-store.sqlite
+PACKED_STORE_FILENAME = 'cache-store.sqlite'
+
+# Entries that don't shrink by at least this much are stored uncompressed (most PDFs)
+MIN_COMPRESSION_RATIO = 0.9
+
+
+def decode_text(raw):
+    # Same result as reading the file in text mode, universal newlines included
+    return raw.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+
+
+class DirectoryCacheStore:
+    """
+    Cache entries as loose files under base_path, e.g. cache/20231/bills/HB 1.html
+
+    Keys are paths relative to base_path. With an empty base_path keys are plain file paths,
+    which is how cache files outside of a session's bills/ and votes/ are handled.
+    """
+
+    def __init__(self, base_path):
+        self.base_path = base_path
+
+    def path(self, key):
+        return join(self.base_path, key)
+
+    def exists(self, key):
+        return exists(self.path(key))
+
+    def read(self, key):
+        path = self.path(key)
+        if not exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def read_text(self, key):
+        raw = self.read(key)
+        return decode_text(raw) if raw is not None else None
+
+    def write(self, key, raw):
+        path = self.path(key)
+        os.makedirs(dirname(path) or '.', exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(raw)
+
+    def keys(self, directory, suffix=''):
+        return sorted(relpath(path, self.base_path or '.')
+                      for path in glob(join(self.path(directory), '*' + suffix)))
+
+    def close(self):
+        pass
+
+
+class PackedCacheStore:
+    """
+    Cache entries packed into a single SQLite file
+
+    Content-addressed: `entries` maps each key to the sha256 of its bytes, and `blobs` holds
+    each distinct body once, zlib-compressed where that helps. The key index is loaded into
+    memory on open, so existence checks never touch disk.
+
+    Writes are committed immediately. They only follow network fetches, and WAL mode lets
+    rebuild worker processes share the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(
+            path, timeout=60, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS blobs (
+                sha256 TEXT PRIMARY KEY,
+                compressed INTEGER NOT NULL,
+                data BLOB NOT NULL
+            )''')
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL
+            )''')
+        self.connection.commit()
+        self.lock = Lock()
+        self.index = dict(self.connection.execute(
+            'SELECT key, sha256 FROM entries'))
+
+    def exists(self, key):
+        return key in self.index
+
+    def read(self, key):
+        with self.lock:
+            sha256 = self.index.get(key)
+            if sha256 is None:
+                return None
+            compressed, data = self.connection.execute(
+                'SELECT compressed, data FROM blobs WHERE sha256 = ?', (sha256,)).fetchone()
+        return zlib.decompress(data) if compressed else data
+
+    def read_text(self, key):
+        raw = self.read(key)
+        return decode_text(raw) if raw is not None else None
+
+    def write(self, key, raw):
+        sha256 = hashlib.sha256(raw).hexdigest()
+        packed = zlib.compress(raw)
+        compressed = len(packed) < len(raw) * MIN_COMPRESSION_RATIO
+        with self.lock:
+            if self.index.get(key) == sha256:
+                return
+            with self.connection:
+                self.connection.execute(
+                    'INSERT OR IGNORE INTO blobs VALUES (?, ?, ?)',
+                    (sha256, int(compressed), packed if compressed else raw))
+                self.connection.execute(
+                    'INSERT OR REPLACE INTO entries VALUES (?, ?)', (key, sha256))
+            self.index[key] = sha256
+
+    def keys(self, directory, suffix=''):
+        prefix = directory.rstrip('/') + '/'
+        return sorted(key for key in self.index
+                      if key.startswith(prefix) and '/' not in key[len(prefix):] and key.endswith(suffix))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+# Loose-file store for callers that pass full cache file paths as keys
+LOOSE_FILES = DirectoryCacheStore('')
+
+open_stores = {}
+open_stores_lock = Lock()
+
+
+def get_cache_store(base_path, backend=CACHE_STORE_BACKEND):
+    """
+    Returns the cache store for a session cache directory, 'directory' or 'packed'
+
+    Stores are opened once per process, so forked rebuild workers don't share SQLite connections
+    """
+    store_key = (os.getpid(), base_path, backend)
+    with open_stores_lock:
+        if store_key not in open_stores:
+            if backend == 'packed':
+                open_stores[store_key] = PackedCacheStore(
+                    join(base_path, PACKED_STORE_FILENAME))
+            elif backend == 'directory':
+                open_stores[store_key] = DirectoryCacheStore(base_path)
+            else:
+                raise ValueError(f'Unknown cache store backend: {backend}')
+        return open_stores[store_key]
@@ -0,0 +1,160 @@
+"""
+Per-run change feed of the combined export, e.g. output/20231/changes/
+
+Each export that changes anything writes a delta, changes/<sequence>.json, of the bills, actions
+and votes added, modified or removed since the export before it:
+
+    {"session": "20231", "sequence": 42, "previousSequence": 41, "generated": "2023-03-15T18:02:11+00:00",
+     "bills": {"added": [...], "modified": [...], "removed": ["HB 5"]},
+     "actions": {"added": [...], "modified": [...], "removed": [{"bill": "HB 1", "id": "HB1-0003"}]},
+     "votes": {"added": [...], "modified": [...], "removed": [{"bill": "HB 1", "action_id": "H1234"}]}}
+
+Added and modified items are as they appear in the all-*.json files, removed ones are just their
+keys. A removed bill's actions and votes are listed as removed too. Sequence numbers only go up,
+so a consumer that loaded the full files at sequence N applies deltas N + 1, N + 2, ... in order
+to catch up. changes/feed.json has the latest sequence and the deltas still kept; a consumer
+behind its `resumableFrom` has to reload the full files.
+
+Exports are diffed against changes/export-index.json, short content hashes of every bill, action
+and vote as of the last export, so it comes out the same however the bills were built (scrape,
+watch mode, merged shards). With no index, e.g. the first export, there's nothing to diff against:
+the sequence moves on as a new baseline, without a delta, and older deltas are dropped.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+from os.path import exists, join
+
+from config import CHANGE_FEED_RETAINED_DELTAS
+
+from functions import read_json, write_json
+
+CHANGE_FEED_DIRNAME = 'changes'
+FEED_FILENAME = 'feed.json'
+INDEX_FILENAME = 'export-index.json'
+
+# Hex digits of sha256 kept per item in the index, plenty to tell versions of one item apart
+HASH_LENGTH = 16
+
+
+def content_hash(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode('utf-8')).hexdigest()[:HASH_LENGTH]
+
+
+def delta_filename(sequence):
+    return f'{sequence:06d}.json'
+
+
+class ChangeFeedWriter:
+    """
+    Diffs bills against the last export as export goes, then writes the delta, feed and index on close
+
+    Bills whose data, actions and votes hash the same as last time are passed over with a single
+    hash, so only changed bills are diffed item by item. Only their changed items are held until close
+    """
+
+    def __init__(self, path, session, retained_deltas=CHANGE_FEED_RETAINED_DELTAS):
+        self.path = path
+        self.session = session
+        self.retained_deltas = retained_deltas
+        self.index_path = join(path, INDEX_FILENAME)
+        self.feed_path = join(path, FEED_FILENAME)
+
+        self.feed = read_json(self.feed_path) if exists(self.feed_path) else {'sequence': 0, 'deltas': []}
+        index = read_json(self.index_path) if exists(self.index_path) else None
+        self.baseline = index is None
+        self.previous = index['bills'] if index else {}
+        self.sequence = max(self.feed['sequence'], index['sequence'] if index else 0)
+        self.bills = {}
+        self.changes = {name: {'added': [], 'modified': [], 'removed': []}
+                        for name in ['bills', 'actions', 'votes']}
+
+    def add(self, bill_data, actions, votes, unchanged=False):
+        """
+        Diffs one exported bill. With `unchanged`, the caller knows it's as it was last export (e.g. a
+        bill export wasn't asked to write) and it's carried over without hashing, if it was in it
+        """
+        key = bill_data['key']
+        previous = self.previous.pop(key, None)
+        if unchanged and previous is not None:
+            self.bills[key] = previous
+            return
+        bill_hash = content_hash([bill_data, actions, votes])
+        if previous is not None and previous['hash'] == bill_hash:
+            self.bills[key] = previous
+            return
+
+        entry = self.bills[key] = {
+            'hash': bill_hash,
+            'data': content_hash(bill_data),
+            'actions': {action['id']: content_hash(action) for action in actions},
+            'votes': {vote['action_id']: content_hash(vote) for vote in votes},
+        }
+        if self.baseline:
+            return
+        if previous is None:
+            self.changes['bills']['added'].append(bill_data)
+            previous = {'data': None, 'actions': {}, 'votes': {}}
+        elif previous['data'] != entry['data']:
+            self.changes['bills']['modified'].append(bill_data)
+        for name, items, id_key in [('actions', actions, 'id'), ('votes', votes, 'action_id')]:
+            for item in items:
+                last = previous[name].get(item[id_key])
+                if last is None:
+                    self.changes[name]['added'].append(item)
+                elif last != entry[name][item[id_key]]:
+                    self.changes[name]['modified'].append(item)
+            self.remove_items(name, key, id_key, previous[name].keys() - entry[name].keys())
+
+    def remove_items(self, name, bill_key, id_key, ids):
+        self.changes[name]['removed'].extend({'bill': bill_key, id_key: id} for id in sorted(ids))
+
+    def counts(self):
+        return {name: {kind: len(items) for kind, items in changes.items()}
+                for name, changes in self.changes.items()}
+
+    def close(self):
+        """
+        Writes the delta (if anything changed), feed and index. Returns the delta's sequence number, or None
+        """
+        # Whatever's left of the last export's bills wasn't exported this time
+        for key, previous in self.previous.items():
+            self.changes['bills']['removed'].append(key)
+            self.remove_items('actions', key, 'id', previous['actions'])
+            self.remove_items('votes', key, 'action_id', previous['votes'])
+
+        os.makedirs(self.path, exist_ok=True)
+        generated = datetime.now(timezone.utc).isoformat(timespec='seconds')
+        written = None
+        if self.baseline:
+            self.sequence += 1
+            for delta in self.feed['deltas']:
+                self.remove_delta(delta)
+            self.feed = {'session': self.session, 'sequence': self.sequence,
+                         'resumableFrom': self.sequence, 'deltas': []}
+            print(f'Change feed baseline at sequence {self.sequence}')
+        elif any(items for changes in self.changes.values() for items in changes.values()):
+            self.sequence += 1
+            written = self.sequence
+            write_json({'session': self.session, 'sequence': self.sequence, 'previousSequence': self.sequence - 1,
+                        'generated': generated, **self.changes},
+                       join(self.path, delta_filename(self.sequence)), pretty=False)
+            deltas = self.feed['deltas'] + [{'sequence': self.sequence, 'file': delta_filename(self.sequence),
+                                             'generated': generated, 'counts': self.counts()}]
+            for delta in deltas[:-self.retained_deltas]:
+                self.remove_delta(delta)
+            deltas = deltas[-self.retained_deltas:]
+            self.feed = {'session': self.session, 'sequence': self.sequence,
+                         'resumableFrom': deltas[0]['sequence'] - 1, 'deltas': deltas}
+        else:
+            print(f'Change feed unchanged at sequence {self.sequence}')
+
+        write_json(self.feed, self.feed_path)
+        write_json({'sequence': self.sequence, 'bills': self.bills}, self.index_path, pretty=False)
+        return written
+
+    def remove_delta(self, delta):
+        path = join(self.path, delta['file'])
+        if exists(path):
+            os.remove(path)
@@ -1,3 +1,4 @@
+from os import environ
 from os.path import join
 
 BASE_URL = 'http://laws.leg.mt.gov/legprd/'
@@ -5,7 +6,80 @@ BASE_URL = 'http://laws.leg.mt.gov/legprd/'
 # SESSION_ID = '20211'  # 2021 regular session
 SESSION_ID = '20231'  # 2023 regular session
 
+# Lets scripts like rebuild-cached.py target another session without editing this file
+SESSION_ID = environ.get('LAWS_SESSION_ID', SESSION_ID)
+
 BILL_LIST_URL = f'http://laws.leg.mt.gov/legprd/LAW0217W$BAIV.return_all_bills?P_SESS={SESSION_ID}'
 
 CACHE_BASE_PATH = join('cache', SESSION_ID)
 OUTPUT_BASE_PATH = join('output', SESSION_ID)
+
+# Where fetched bill pages and votes are cached under CACHE_BASE_PATH: 'directory' for loose
+# bills/*.html, votes/*.html and votes/*.pdf files, or 'packed' for a single compressed
+# cache-store.sqlite file. Convert an existing cache with migrate-cache.py
+CACHE_STORE_BACKEND = 'directory'
+
+# Fetch concurrency. Bill pages and floor votes come from LAWS (laws.leg.mt.gov),
+# committee vote sheet PDFs from leg.mt.gov, so each host gets its own cap
+BILL_FETCH_WORKERS = 8
+VOTE_FETCH_WORKERS = 16
+HOST_CONNECTION_LIMITS = {
+    'laws.leg.mt.gov': 6,
+    'leg.mt.gov': 8,
+}
+
+# Connection errors and 5xx responses are retried this many times, first after
+# FETCH_RETRY_BACKOFF_SECONDS, doubling each time
+FETCH_RETRIES = 2
+FETCH_RETRY_BACKOFF_SECONDS = 2
+
+# Sends every request to this origin instead, with the real hostname in the Host header, e.g.
+# LAWS_FETCH_ORIGIN=http://127.0.0.1:8765 to scrape a local laws_standin.py. Unset for the live sites
+FETCH_ORIGIN = environ.get('LAWS_FETCH_ORIGIN')
+
+# Wall-clock seconds a scrape spends refreshing bills before exporting what it has, None for no limit.
+# Under a budget, bills are refreshed highest priority first (see RefreshManifest.priority) and
+# any not reached are left for the next scrape. Scripts take `--budget SECONDS` to override it
+SCRAPE_TIME_BUDGET_SECONDS = None
+# Bills with a transmittal or amended return deadline this many days out or fewer get refresh priority
+DEADLINE_PRIORITY_DAYS = 3
+
+# How often watch-session.py checks the bill list for bills to refresh
+WATCH_INTERVAL_SECONDS = 5 * 60
+
+# Bills whose status date is today get re-fetched at most this often, since their
+# pages can pick up actions without the bill list row changing
+SAME_DAY_REFETCH_HOURS = 3
+
+# Parser backend for bill pages and floor vote pages, 'bs4' or 'lxml'. Both produce identical
+# output (checked by tests/parser-equivalence.py), lxml is several times faster
+PARSER_BACKEND = 'lxml'
+
+# Formats for the combined all-*.json output files, from 'pretty' (indented .json the frontend reads),
+# 'compact' (.min.json) and 'jsonl' (.jsonl, one record per line). COMBINED_EXPORT_GZIP also
+# writes a precompressed .gz copy of each
+COMBINED_EXPORT_FORMATS = ['pretty']
+COMBINED_EXPORT_GZIP = False
+
+# Also keep a queryable SQLite copy of the output in output/<session>/laws.sqlite, see output_store.py
+WRITE_OUTPUT_DATABASE = True
+
+# Also write name-by-name votes as a columnar matrix for analysis, output/<session>/vote-matrix.npz,
+# with the lawmaker roster its columns are numbered by in lawmakers.json. See vote_matrix.py
+WRITE_VOTE_MATRIX = True
+
+# Also write a change feed in output/<session>/changes/, one delta per export that changed anything,
+# listing added, modified and removed bills, actions and votes for consumers to apply instead of
+# reloading the all-*.json files. Only the latest CHANGE_FEED_RETAINED_DELTAS are kept. See change_feed.py
+WRITE_CHANGE_FEED = True
+CHANGE_FEED_RETAINED_DELTAS = 500
+
+# Vote sheet names to resolve by hand, {name as printed: name as on floor votes}, for any that
+# name_resolution.NameResolver can't match on its own. See unresolved-names.json after an export
+LAWMAKER_NAME_OVERRIDES = {}
+
+# Vote pages that come back missing ("No Vote Records Found", or a PDF that isn't there) are
+# recorded in cache/<session>/missing-votes.json and not re-requested until their retry is due.
+# The wait starts at MISSING_VOTE_RETRY_HOURS and doubles per failed attempt, up to the max
+MISSING_VOTE_RETRY_HOURS = 6
+MISSING_VOTE_MAX_RETRY_HOURS = 7 * 24
@@ -0,0 +1,18 @@
+# Extracts text from every cached committee vote sheet PDF into .pdf.txt sidecars, across a process pool
+# PDFs whose sidecar is already current are skipped, so each PDF is only decoded once
+# Run as `python3 extract-committee-text.py [session] [processes]`
+import os
+import sys
+
+if len(sys.argv) > 1:
+    os.environ['LAWS_SESSION_ID'] = sys.argv[1]
+processes = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+
+from config import CACHE_BASE_PATH
+
+from cache_store import get_cache_store
+from models.vote import extract_committee_vote_texts
+
+pdf_keys = get_cache_store(CACHE_BASE_PATH).keys('votes', '.pdf')
+print(f'Extracting text from {len(pdf_keys)} PDFs across {processes} processes')
+extract_committee_vote_texts(pdf_keys, processes)
@@ -0,0 +1,380 @@
+import codecs
+import hashlib
+import json
+import requests
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime, timezone
+from os.path import basename, dirname, join
+from requests.adapters import HTTPAdapter
+from threading import BoundedSemaphore, Lock
+from urllib.parse import urlparse, urlsplit, urlunsplit
+
+from cache_store import DirectoryCacheStore, LOOSE_FILES
+from functions import merge_changes, read_json, write_json
+from instrumentation import STATS
+from config import BILL_FETCH_WORKERS, VOTE_FETCH_WORKERS, HOST_CONNECTION_LIMITS, FETCH_RETRIES, FETCH_RETRY_BACKOFF_SECONDS, FETCH_ORIGIN
+
+# Per-directory index of response metadata, e.g. cache/20231/bills/response-meta.json
+RESPONSE_META_FILENAME = 'response-meta.json'
+
+# Bytes read at a time from streamed responses, see HttpClient.stream
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def hash_bytes(raw):
+    return hashlib.sha256(raw).hexdigest()
+
+
+class FetchResult:
+    """
+    Response from HttpClient.get
+
+    - status_code - HTTP status, with 304s reported as 200 since the body is served from cache
+    - content/text - response body as bytes/str
+    - unchanged - True if the body matches what's already cached (304 or identical bytes)
+    """
+
+    def __init__(self, url, status_code, content, headers, text=None, response=None):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+        self.unchanged = False
+        self._text = text
+        self._response = response
+
+    @property
+    def text(self):
+        # Decoded lazily, requests' charset detection is slow on PDFs we never read as text
+        if self._text is None:
+            self._text = self._response.text
+        return self._text
+
+    def body(self, binary):
+        # Bytes as written to the cache
+        return self.content if binary else self.text.encode('utf-8')
+
+
+class StreamedResponse:
+    """
+    Iterates a streamed response body's text chunks, see HttpClient.stream
+
+    - result - the complete FetchResult, set once iteration finishes
+    """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.result = None
+
+    def __iter__(self):
+        self.result = yield from self.chunks
+
+
+class HttpClient:
+    """
+    Shared HTTP client for LAWS and leg.mt.gov requests
+
+    Uses one pooled, keep-alive requests.Session with gzip negotiation for everything.
+
+    When a fetch is tied to a cache file, ETag/Last-Modified and a content hash are recorded
+    in a response-meta.json index in that file's directory so the next fetch can be sent as
+    a conditional GET. Cache files are keys in a cache store (see cache_store.py), plain file
+    paths by default. A 304, or a 200 with identical bytes, comes back flagged as unchanged
+    and `store` leaves the cache file alone.
+
+    Metadata is held in memory until `save` is called.
+
+    - retries/retry_backoff - connection errors and 5xx responses are retried `retries` times,
+      waiting `retry_backoff` seconds and doubling
+    - origin - if set, requests go to this scheme://host[:port] instead, with the URL's own
+      host in the Host header, see laws_standin.py. URLs and cache metadata are unaffected
+    """
+
+    def __init__(self, host_limits=HOST_CONNECTION_LIMITS, retries=FETCH_RETRIES,
+                 retry_backoff=FETCH_RETRY_BACKOFF_SECONDS, origin=FETCH_ORIGIN):
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.origin = origin
+        self.session = requests.Session()
+        # Through an origin every host's requests share one pool
+        pool_maxsize = sum(host_limits.values()) if origin else max(host_limits.values(), default=10)
+        adapter = HTTPAdapter(pool_connections=max(len(host_limits), 1), pool_maxsize=pool_maxsize or 10)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({'Accept-Encoding': 'gzip, deflate'})
+
+        self.meta = {}  # (store, directory) -> {filename: metadata}
+        self.dirty = set()
+        self.lock = Lock()
+
+    def get(self, url, cache_path=None, binary=False, store=LOOSE_FILES):
+        meta, headers = self.conditional_headers(url, cache_path, store)
+
+        with STATS.timer('http.get'):
+            r = self.send(url, headers)
+        STATS.count('http.requests')
+        STATS.count('http.bytes', len(r.content))
+
+        if r.status_code == 304:
+            STATS.count('http.notModified')
+            content = store.read(cache_path)
+            result = FetchResult(url, 200, content, r.headers,
+                                 text=None if binary else content.decode('utf-8'))
+            result.unchanged = True
+            return result
+
+        if r.status_code != 200:
+            STATS.count(f'http.status.{r.status_code}')
+        result = FetchResult(url, r.status_code, r.content, r.headers, response=r)
+        self.check_unchanged(result, meta, cache_path, binary, store)
+        return result
+
+    def stream(self, url, cache_path=None, store=LOOSE_FILES, slot=None):
+        """
+        Yields a text response's body in decoded chunks as it downloads, so it can be parsed as it arrives
+
+        Conditional GETs work the same as `get`, a 304 yields the cached body. Once the body is
+        exhausted the generator returns its FetchResult, ready for `store`, see StreamedResponse.
+        `slot` is held for the whole download.
+        """
+        with slot or nullcontext():
+            meta, headers = self.conditional_headers(url, cache_path, store)
+            r = self.send(url, headers, stream=True)
+            STATS.count('http.requests')
+
+            if r.status_code == 304:
+                STATS.count('http.notModified')
+                content = store.read(cache_path)
+                text = content.decode('utf-8')
+                yield text
+                result = FetchResult(url, 200, content, r.headers, text=text)
+                result.unchanged = True
+                return result
+
+            if r.status_code != 200:
+                STATS.count(f'http.status.{r.status_code}')
+            # Same charset as requests' r.text when the response names one
+            decoder = codecs.getincrementaldecoder(r.encoding or 'utf-8')(errors='replace')
+            raw_chunks = []
+            text_chunks = []
+            for raw in r.iter_content(STREAM_CHUNK_SIZE):
+                raw_chunks.append(raw)
+                text_chunks.append(decoder.decode(raw))
+                if text_chunks[-1]:
+                    yield text_chunks[-1]
+            text_chunks.append(decoder.decode(b'', final=True))
+            if text_chunks[-1]:
+                yield text_chunks[-1]
+
+        content = b''.join(raw_chunks)
+        STATS.count('http.bytes', len(content))
+        result = FetchResult(url, r.status_code, content, r.headers, text=''.join(text_chunks))
+        self.check_unchanged(result, meta, cache_path, False, store)
+        return result
+
+    def send(self, url, headers, stream=False):
+        """
+        GETs a URL, through `origin` if there is one, retrying transient failures
+        """
+        target = url
+        if self.origin:
+            parts = urlsplit(url)
+            target = urlunsplit(urlsplit(self.origin)[:2] + parts[2:4] + ('',))
+            headers = {**headers, 'Host': parts.netloc}
+        for attempt in range(self.retries + 1):
+            if attempt:
+                STATS.count('http.retries')
+                time.sleep(self.retry_backoff * 2 ** (attempt - 1))
+            try:
+                r = self.session.get(target, headers=headers, stream=stream)
+            except requests.ConnectionError:
+                if attempt == self.retries:
+                    raise
+                continue
+            if r.status_code < 500 or attempt == self.retries:
+                return r
+            r.close()
+
+    def conditional_headers(self, url, cache_path, store):
+        """
+        Returns a cache file's response metadata (None if there's no cache file) and the
+        conditional GET headers it allows
+        """
+        meta = self.get_meta(cache_path, store) if cache_path else None
+        headers = {}
+        if meta and meta['url'] == url and store.exists(cache_path):
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('lastModified'):
+                headers['If-Modified-Since'] = meta['lastModified']
+        return meta, headers
+
+    def check_unchanged(self, result, meta, cache_path, binary, store):
+        # Flags a 200 whose body is identical to the cached copy
+        if cache_path and result.status_code == 200:
+            if meta is not None:
+                cached_hash = meta['sha256']
+            else:
+                cached = store.read(cache_path)
+                cached_hash = hash_bytes(cached) if cached is not None else None
+            result.unchanged = cached_hash == hash_bytes(result.body(binary))
+            if result.unchanged:
+                STATS.count('http.unchangedBody')
+
+    def store(self, result, cache_path, binary=False, store=LOOSE_FILES):
+        """
+        Writes a fetched body to the cache (unless it's unchanged) and records its metadata
+
+        Text responses are written as UTF-8, same as a text-mode write of `result.text`
+        """
+        raw = result.body(binary)
+        if not (result.unchanged and store.exists(cache_path)):
+            store.write(cache_path, raw)
+        self.set_meta(cache_path, store, {
+            'url': result.url,
+            'etag': result.headers.get('ETag'),
+            'lastModified': result.headers.get('Last-Modified'),
+            'sha256': hash_bytes(raw),
+            'fetched': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        })
+
+    def get_meta(self, cache_path, store=LOOSE_FILES):
+        return self.load_directory(store, dirname(cache_path)).get(basename(cache_path))
+
+    def set_meta(self, cache_path, store, meta):
+        directory = dirname(cache_path)
+        index = self.load_directory(store, directory)
+        with self.lock:
+            index[basename(cache_path)] = meta
+            self.dirty.add((store, directory))
+
+    def load_directory(self, store, directory):
+        # Indexes live in the same store as the files they describe
+        with self.lock:
+            if (store, directory) not in self.meta:
+                raw = store.read(join(directory, RESPONSE_META_FILENAME))
+                self.meta[(store, directory)] = json.loads(raw) if raw is not None else {}
+            return self.meta[(store, directory)]
+
+    def save(self, fragment_path=None):
+        """
+        Writes out changed metadata indexes. With `fragment_path`, they all go to that one file
+        instead, for a shard of a sharded scrape to leave the shared indexes to merge_fragments
+        """
+        with self.lock:
+            dirty = sorted(self.dirty, key=lambda dirty: dirty[1])
+            if fragment_path:
+                write_json([{'base': store.base_path, 'directory': directory,
+                             'index': self.meta[(store, directory)]} for store, directory in dirty],
+                           fragment_path, log=False)
+            else:
+                for store, directory in dirty:
+                    index = self.meta[(store, directory)]
+                    text = json.dumps({key: index[key] for key in sorted(index)}, indent=1)
+                    store.write(join(directory, RESPONSE_META_FILENAME), text.encode('utf-8'))
+            self.dirty = set()
+
+    def merge_fragments(self, fragment_paths):
+        """
+        Folds metadata saved to fragments by save(fragment_path) into the shared indexes, to be
+        written out by save(). Directory cache stores only, since fragments name them by base path
+        """
+        fragments = {}
+        for path in fragment_paths:
+            for entry in read_json(path):
+                fragments.setdefault((entry['base'], entry['directory']), []).append(entry['index'])
+        stores = {}
+        for (base, directory), indexes in fragments.items():
+            store = stores.setdefault(base, DirectoryCacheStore(base) if base else LOOSE_FILES)
+            merged = merge_changes(self.load_directory(store, directory), indexes)
+            with self.lock:
+                self.meta[(store, directory)] = merged
+                self.dirty.add((store, directory))
+
+
+class FetchScheduler:
+    """
+    Bounded-concurrency scheduler for LAWS downloads
+
+    Bills are built on one worker pool and their votes on a second, so a bill worker
+    can wait on its votes without starving the pool it's running on. Every HTTP request
+    also holds a slot from its host's limit for as long as it's in flight.
+
+    Results come back in submission order, so output matches a serial scrape.
+
+    - bill_workers - max bills built at once (1 runs serially on the calling thread)
+    - vote_workers - max votes resolved at once (1 runs serially on the calling thread)
+    - host_limits - max concurrent requests per hostname, hosts not listed are uncapped
+    - client - HttpClient requests go through, shared by every scheduler by default
+    """
+
+    def __init__(self,
+                 bill_workers=BILL_FETCH_WORKERS,
+                 vote_workers=VOTE_FETCH_WORKERS,
+                 host_limits=HOST_CONNECTION_LIMITS,
+                 client=None):
+        self.bill_workers = bill_workers
+        self.bill_pool = ThreadPoolExecutor(
+            bill_workers, thread_name_prefix='bill') if bill_workers > 1 else None
+        self.vote_pool = ThreadPoolExecutor(
+            vote_workers, thread_name_prefix='vote') if vote_workers > 1 else None
+        self.host_slots = {host: BoundedSemaphore(limit)
+                           for host, limit in host_limits.items()}
+        self.client = client or SHARED_CLIENT
+
+    def get(self, url, cache_path=None, binary=False, store=LOOSE_FILES):
+        slot = self.host_slots.get(urlparse(url).hostname)
+        if slot is None:
+            return self.client.get(url, cache_path=cache_path, binary=binary, store=store)
+        with slot:
+            return self.client.get(url, cache_path=cache_path, binary=binary, store=store)
+
+    def stream(self, url, cache_path=None, store=LOOSE_FILES):
+        return StreamedResponse(self.client.stream(
+            url, cache_path=cache_path, store=store, slot=self.host_slots.get(urlparse(url).hostname)))
+
+    def store(self, result, cache_path, binary=False, store=LOOSE_FILES):
+        self.client.store(result, cache_path, binary=binary, store=store)
+
+    def map_bills(self, fn, items):
+        return self._map(self.bill_pool, fn, items)
+
+    def imap_bills(self, fn, items):
+        """
+        Like map_bills, but yields results in order as they're ready, with no more than two per
+        bill worker submitted ahead of the one being consumed, so finished bills don't pile up
+        """
+        if self.bill_pool is None:
+            for item in items:
+                yield fn(item)
+            return
+        pending = deque()
+        for item in items:
+            pending.append(self.bill_pool.submit(fn, item))
+            if len(pending) > 2 * self.bill_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def map_votes(self, fn, items):
+        return self._map(self.vote_pool, fn, items)
+
+    def _map(self, pool, fn, items):
+        if pool is None:
+            return [fn(item) for item in items]
+        return list(pool.map(fn, items))
+
+    def close(self):
+        for pool in [self.bill_pool, self.vote_pool]:
+            if pool is not None:
+                pool.shutdown()
+        self.client.save()
+
+
+SHARED_CLIENT = HttpClient()
+
+# One-request-at-a-time default for building single bills/votes outside of a BillList
+SERIAL_SCHEDULER = FetchScheduler(bill_workers=1, vote_workers=1)
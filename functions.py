@@ -1,4 +1,5 @@
 import json
+import os
 
 
 def make_bill_key(identifier):
@@ -7,11 +8,34 @@ def make_bill_key(identifier):
 
 
 def write_json(data, path, pretty=True, log=True):
+    """
+    Writes data as JSON, skipping the write if the file already has identical contents
+
+    Returns whether the file changed
+    """
     indent = 4 if pretty else 0
-    with open(path, 'w') as f:
-        json.dump(data, f, indent=indent)
+    changed = write_if_changed(json.dumps(data, indent=indent), path)
     if log:
-        print('Written to', path)
+        print('Written to' if changed else 'Unchanged', path)
+    return changed
+
+
+def write_if_changed(text, path):
+    """
+    Writes text (or bytes) to path atomically (temp file + rename), unless the file already holds the same contents
+
+    Keeps untouched output files out of git diffs and commits
+    """
+    raw = text.encode('utf-8') if isinstance(text, str) else text
+    if os.path.exists(path) and os.path.getsize(path) == len(raw):
+        with open(path, 'rb') as f:
+            if f.read() == raw:
+                return False
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(raw)
+    os.replace(temp_path, path)
+    return True
 
 
 def read_json(path):
@@ -21,15 +45,17 @@ def read_json(path):
         return data
 
 
-def clean_name(raw):
+def merge_changes(original, copies):
     """
-    Ensures standard forms for lawmaker names 
-
-    TODO - implement this as necessary
+    Combines dicts that each started as a copy of `original` and were changed independently,
+    e.g. by shards of a sharded scrape. Keys a copy changed or added take its value, keys a
+    copy dropped are dropped, and everything else stays as it was
     """
-    replacements = {
-        'Johnny B Good': 'John Good'  # Example
-    }
-    if raw in replacements.keys():
-        return replacements[raw]
-    return raw
+    merged = dict(original)
+    for copy in copies:
+        for key in original.keys() - copy.keys():
+            merged.pop(key, None)
+        for key, value in copy.items():
+            if original.get(key) != value:
+                merged[key] = value
+    return merged
@@ -0,0 +1,145 @@
+import json
+import logging
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from threading import Lock
+
+# Samples kept per timer for percentiles, past this only count/total/max keep updating
+MAX_TIMER_SAMPLES = 100000
+
+# The scraper's own loggers, by module or package name. Verbose logging only turns these up to DEBUG
+PROJECT_LOGGERS = ['models', 'fetch', 'parse_cache', 'cache_store', 'output_store', 'vote_matrix',
+                   'name_resolution', 'change_feed', 'sharding', 'laws_standin', 'watch-session']
+
+
+def configure_logging(verbose=False):
+    """
+    Sends log messages to the console the way the scraper's prints used to look
+
+    Per-bill and per-vote messages are logged at DEBUG, so they're only formatted when verbose.
+    The root logger stays at INFO either way, so libraries' debug output (urllib3, PyPDF2) stays out
+    """
+    logging.basicConfig(format='%(message)s')
+    logging.getLogger().setLevel(logging.INFO)
+    for name in PROJECT_LOGGERS:
+        logging.getLogger(name).setLevel(logging.DEBUG if verbose else logging.NOTSET)
+
+
+class RunStats:
+    """
+    Thread-safe counters and timers for one scrape, reported as JSON
+
+    - count(name, n) - adds to a counter, e.g. 'http.bytes'
+    - timer(name) - context manager adding one timed sample, e.g. 'parse.bill'
+    - stage(name) - timer for a whole pipeline stage, reported separately
+
+    Worker processes keep their own RunStats, sent back with `snapshot` and combined with `merge`.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = datetime.now(timezone.utc)
+            self.counters = {}
+            self.timers = {}
+            self.stages = {}
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_time(self, name, seconds):
+        with self.lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                timer = self.timers[name] = {'count': 0, 'seconds': 0.0, 'max': 0.0, 'samples': []}
+            timer['count'] += 1
+            timer['seconds'] += seconds
+            timer['max'] = max(timer['max'], seconds)
+            if len(timer['samples']) < MAX_TIMER_SAMPLES:
+                timer['samples'].append(seconds)
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            with self.lock:
+                self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': dict(self.counters),
+                'timers': {name: dict(timer, samples=list(timer['samples']))
+                           for name, timer in self.timers.items()},
+                'stages': dict(self.stages),
+            }
+
+    def merge(self, snapshot):
+        with self.lock:
+            for name, n in snapshot['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + n
+            for name, other in snapshot['timers'].items():
+                timer = self.timers.setdefault(
+                    name, {'count': 0, 'seconds': 0.0, 'max': 0.0, 'samples': []})
+                timer['count'] += other['count']
+                timer['seconds'] += other['seconds']
+                timer['max'] = max(timer['max'], other['max'])
+                room = MAX_TIMER_SAMPLES - len(timer['samples'])
+                timer['samples'].extend(other['samples'][:room])
+            for name, seconds in snapshot['stages'].items():
+                self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def report(self, **extra):
+        """
+        Returns the run report, with any extra top-level fields (session, options) added in
+        """
+        def summarize(timer):
+            samples = sorted(timer['samples'])
+            return {
+                'count': timer['count'],
+                'seconds': round(timer['seconds'], 3),
+                'meanMs': round(timer['seconds'] / timer['count'] * 1000, 3),
+                'p50Ms': round(percentile(samples, 0.5) * 1000, 3),
+                'p95Ms': round(percentile(samples, 0.95) * 1000, 3),
+                'maxMs': round(timer['max'] * 1000, 3),
+            }
+
+        with self.lock:
+            return {
+                'started': self.started.isoformat(timespec='seconds'),
+                'finished': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                **extra,
+                'stages': {name: round(seconds, 3) for name, seconds in self.stages.items()},
+                'counters': dict(sorted(self.counters.items())),
+                'timers': {name: summarize(timer) for name, timer in sorted(self.timers.items())},
+            }
+
+    def save(self, path, **extra):
+        with open(path, 'w') as f:
+            json.dump(self.report(**extra), f, indent=4)
+        print('Run report written to', path)
+
+
+def percentile(ordered, fraction):
+    # Nearest-rank percentile of already sorted values
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+# Stats for the current process's scrape
+STATS = RunStats()
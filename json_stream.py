@@ -0,0 +1,111 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+
+# File extension for each combined file format
+FORMAT_EXTENSIONS = {
+    'pretty': '.json',
+    'compact': '.min.json',
+    'jsonl': '.jsonl',
+}
+
+
+class JsonArrayWriter:
+    """
+    Writes a list of JSON-serializable items to disk one item at a time, so the whole list
+    never has to be held in memory
+
+    Formats:
+    - pretty - JSON array indented by 4, byte-identical to write_json output for the same list
+    - compact - JSON array without whitespace
+    - jsonl - one compact item per line (JSON Lines)
+
+    Output goes to a temp file that replaces `path` on close, unless the result is byte-identical
+    to what's already there. With gzip, a precompressed `path`.gz copy is kept alongside it.
+    """
+
+    def __init__(self, path, format='pretty', gzip=False):
+        self.path = path
+        self.format = format
+        self.gzip = gzip
+        self.temp_path = f'{path}.tmp'
+        self.file = open(self.temp_path, 'wb')
+        self.hash = hashlib.sha256()
+        self.size = 0
+        self.count = 0
+
+    def write(self, item):
+        if self.format == 'pretty':
+            serialized = json.dumps(item, indent=4).replace('\n', '\n    ')
+            chunk = ('[\n    ' if self.count == 0 else ',\n    ') + serialized
+        elif self.format == 'compact':
+            serialized = json.dumps(item, separators=(',', ':'))
+            chunk = ('[' if self.count == 0 else ',') + serialized
+        elif self.format == 'jsonl':
+            chunk = json.dumps(item, separators=(',', ':')) + '\n'
+        else:
+            raise ValueError(f'Unknown JSON format: {self.format}')
+        self._write_raw(chunk)
+        self.count += 1
+
+    def extend(self, items):
+        for item in items:
+            self.write(item)
+
+    def _write_raw(self, chunk):
+        raw = chunk.encode('utf-8')
+        self.file.write(raw)
+        self.hash.update(raw)
+        self.size += len(raw)
+
+    def close(self):
+        """
+        Finishes the file, returning whether it changed
+        """
+        if self.format == 'pretty':
+            self._write_raw('\n]' if self.count else '[]')
+        elif self.format == 'compact':
+            self._write_raw(']' if self.count else '[]')
+        self.file.close()
+
+        if self._matches_existing():
+            os.remove(self.temp_path)
+            changed = False
+        else:
+            os.replace(self.temp_path, self.path)
+            changed = True
+
+        gzip_path = f'{self.path}.gz'
+        if self.gzip and (changed or not os.path.exists(gzip_path)):
+            write_gzip_copy(self.path, gzip_path)
+        return changed
+
+    def _matches_existing(self):
+        if not os.path.exists(self.path) or os.path.getsize(self.path) != self.size:
+            return False
+        existing = hashlib.sha256()
+        with open(self.path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                existing.update(block)
+        return existing.digest() == self.hash.digest()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+            os.remove(self.temp_path)
+
+
+def write_gzip_copy(path, gzip_path):
+    # Fixed mtime and no embedded filename keep the compressed bytes stable between runs
+    temp_path = f'{gzip_path}.tmp'
+    with open(path, 'rb') as source, open(temp_path, 'wb') as raw:
+        with gzip.GzipFile(filename='', mode='wb', fileobj=raw, mtime=0) as compressed:
+            shutil.copyfileobj(source, compressed)
+    os.replace(temp_path, gzip_path)
@@ -0,0 +1,234 @@
+"""
+Local stand-in for LAWS and leg.mt.gov, serving a session's cached pages at their live URLs
+
+Lets the whole scrape run offline, e.g. for load-test.py, with the scraper pointed at it through
+FETCH_ORIGIN (see config.py). Which URL serves which cache entry comes from the session's last
+export: bill pages from all-bills.json, floor vote pages and committee vote sheets from each
+bill's --votes.json. Requests are matched on Host header, path and query, so http/https doesn't matter.
+
+Like the live sites, unknown VoteTabulation URLs get LAWS' "No Vote Records Found" page and other
+unknown URLs a 404. Responses carry an ETag and answer a matching If-None-Match with a 304.
+
+To see how the scraper copes:
+- latency, jitter - seconds added to every response, jitter drawn uniformly on top
+- error_rate - fraction of requests answered with a 503
+- missing_vote_rate - fraction of vote URLs served missing, "No Vote Records Found" for floor votes
+  and a 404 for committee PDFs. Picked by URL hash, so it's the same votes every run
+- bill_limit - only list the first N bills, for quick runs
+
+Run on its own as e.g. `python3 laws_standin.py --port 8765 --latency 0.05`, then scrape with
+LAWS_FETCH_ORIGIN=http://127.0.0.1:8765 set
+"""
+import argparse
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from glob import glob
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os.path import join
+from urllib.parse import urlsplit
+
+from config import BILL_LIST_URL, CACHE_BASE_PATH, OUTPUT_BASE_PATH
+
+from cache_store import get_cache_store
+from functions import read_json
+from models.bill_list import BILL_TABLE_FIRST_HEADER, split_rows
+
+log = logging.getLogger(__name__)
+
+NO_VOTE_RECORDS_PAGE = b'<html><body><p>No Vote Records Found for this Action.</p></body></html>'
+FLOOR_VOTE_PATH = 'VoteTabulation'
+
+
+def route_key(host, path):
+    # Host header and path with query, e.g. ('laws.leg.mt.gov', '/legprd/LAW0211W$BLAC.VoteTabulation?P_VOTE_SEQ=H1&P_SESS=20231')
+    return host.lower(), path
+
+
+def url_route_key(url):
+    parts = urlsplit(url)
+    return route_key(parts.netloc, parts.path + (f'?{parts.query}' if parts.query else ''))
+
+
+def truncate_bill_list(text, bill_limit):
+    """
+    Bill list page cut off after its first `bill_limit` bill rows
+    """
+    pieces = []
+    rows = None
+    for piece in split_rows([text]):
+        if rows is None and BILL_TABLE_FIRST_HEADER in piece:
+            rows = 0
+        elif rows is not None and '<td' in piece.lower():
+            rows += 1
+            if rows > bill_limit:
+                break
+        pieces.append(piece)
+    return ''.join(pieces) + '\n</table>\n</form>\n'
+
+
+class StandinServer:
+    """
+    Threaded HTTP server standing in for LAWS and leg.mt.gov, see module docstring
+
+    `start` serves on a background thread, `url` is the origin to scrape through. `stats` counts
+    requests, statuses, bytes and injected failures, `reset_stats` zeroes them between runs.
+    """
+
+    def __init__(self, port=0, cache_base_path=CACHE_BASE_PATH, output_base_path=OUTPUT_BASE_PATH,
+                 bill_list_url=BILL_LIST_URL, latency=0.0, jitter=0.0, error_rate=0.0,
+                 missing_vote_rate=0.0, bill_limit=None, seed=0):
+        self.store = get_cache_store(cache_base_path)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.missing_vote_rate = missing_vote_rate
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = Counter()
+
+        with open(join(cache_base_path, 'all-introduced-bills.html')) as f:
+            bill_list = f.read()
+        if bill_limit is not None:
+            bill_list = truncate_bill_list(bill_list, bill_limit)
+        self.bill_list_key = url_route_key(bill_list_url)
+        self.bill_list = bill_list.encode('utf-8')
+
+        self.routes = {}  # route key -> (cache key, is vote)
+        for bill in read_json(join(output_base_path, 'all-bills.json')):
+            self.routes[url_route_key(bill['billPageUrl'])] = (join('bills', f"{bill['key']}.html"), False)
+        for path in glob(join(output_base_path, '*--votes.json')):
+            with open(path) as f:
+                votes = json.load(f)
+            for vote in votes:
+                if vote.get('url'):
+                    extension = 'pdf' if vote['type'] == 'committee' else 'html'
+                    self.routes[url_route_key(vote['url'])] = (join('votes', f"{vote['action_id']}.{extension}"), True)
+
+        standin = self
+
+        class Handler(StandinHandler):
+            server_standin = standin
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='laws-standin', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = Counter()
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.stats[name] += n
+
+    def is_missing_vote(self, url_key):
+        # Stable per URL and seed, unlike error_rate's per-request draws
+        digest = hashlib.sha256(f'{self.seed}:{url_key[0]}{url_key[1]}'.encode('utf-8')).digest()
+        return int.from_bytes(digest[:8], 'big') / 2 ** 64 < self.missing_vote_rate
+
+    def respond(self, host, path, if_none_match):
+        """
+        Returns (status, body, headers) for a GET
+        """
+        with self.lock:
+            delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+            fail = self.random.random() < self.error_rate if self.error_rate else False
+        if delay:
+            time.sleep(delay)
+        if fail:
+            self.count('injectedErrors')
+            return 503, b'Service Unavailable', {'Content-Type': 'text/plain'}
+
+        key = route_key(host, path)
+        body = None
+        if key == self.bill_list_key:
+            body = self.bill_list
+        elif key in self.routes:
+            cache_key, is_vote = self.routes[key]
+            if is_vote and self.missing_vote_rate and self.is_missing_vote(key):
+                self.count('injectedMissingVotes')
+            else:
+                body = self.store.read(cache_key)
+
+        if body is None:
+            if FLOOR_VOTE_PATH in path:
+                return 200, NO_VOTE_RECORDS_PAGE, {'Content-Type': 'text/html'}
+            return 404, b'Not Found', {'Content-Type': 'text/plain'}
+
+        etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        if if_none_match == etag:
+            return 304, b'', {'ETag': etag}
+        content_type = 'application/pdf' if path.endswith('.pdf') else 'text/html'
+        return 200, body, {'Content-Type': content_type, 'ETag': etag}
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_standin = None
+
+    def do_GET(self):
+        standin = self.server_standin
+        host = self.headers.get('Host') or ''
+        status, body, headers = standin.respond(host, self.path, self.headers.get('If-None-Match'))
+        standin.count('requests')
+        standin.count(f'status.{status}')
+        standin.count('bytes', len(body))
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug('%s - %s', self.address_string(), format % args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a cached session at its LAWS and leg.mt.gov URLs')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='up to this many more seconds, at random')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with a 503')
+    parser.add_argument('--missing-vote-rate', type=float, default=0.0,
+                        help='fraction of vote URLs served as missing')
+    parser.add_argument('--bills', type=int, default=None, help='only list this many bills')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    standin = StandinServer(port=args.port, latency=args.latency, jitter=args.jitter,
+                            error_rate=args.error_rate, missing_vote_rate=args.missing_vote_rate,
+                            bill_limit=args.bills, seed=args.seed)
+    print(f'Serving {len(standin.routes)} cached pages on {standin.url}, '
+          f'scrape with LAWS_FETCH_ORIGIN={standin.url}')
+    try:
+        standin.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        standin.server.server_close()
+        print('Requests:', dict(sorted(standin.stats.items())))
+
+
+if __name__ == '__main__':
+    main()
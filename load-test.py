@@ -0,0 +1,148 @@
+# End-to-end scrape load test against a local LAWS stand-in (see laws_standin.py)
+# Scrapes and exports the current session in a scratch directory, through the stand-in instead of
+# the live sites, and reports wall time, requests/sec and cache hit ratios per run, saved as JSON.
+# Runs share the scratch directory, so each one starts from the cache the previous one left:
+# - cold - nothing cached, every page fetched
+# - warm - a normal rerun, planned from the refresh manifest
+# - refresh - forced refresh of every bill, so pages come back as 304s to conditional GETs
+# Run as `python3 load-test.py`, or e.g.
+#   python3 load-test.py --bills 200 --latency 0.05 --jitter 0.1 --error-rate 0.02 --missing-vote-rate 0.01
+#   LAWS_SESSION_ID=20211 python3 load-test.py --runs cold warm --streaming
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from os.path import abspath
+
+from config import SESSION_ID, BILL_LIST_URL, CACHE_BASE_PATH, OUTPUT_BASE_PATH, BILL_FETCH_WORKERS, VOTE_FETCH_WORKERS
+
+from benchmark import git_commit
+from fetch import FetchScheduler, HttpClient
+from instrumentation import STATS
+from laws_standin import StandinServer
+from models.bill_list import BillList
+
+RUNS = ['cold', 'warm', 'refresh']
+
+
+def ratio(hits, misses):
+    return round(hits / (hits + misses), 3) if hits + misses else None
+
+
+def run_scrape(run, standin, args):
+    """
+    Scrapes and exports once through the stand-in, returning the run's measurements
+    """
+    STATS.reset()
+    standin.reset_stats()
+    client = HttpClient(origin=standin.url, retry_backoff=args.retry_backoff)
+    scheduler = FetchScheduler(bill_workers=args.bill_workers, vote_workers=args.vote_workers, client=client)
+    output = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        bill_list = BillList(BILL_LIST_URL, force_refresh=run == 'refresh', scheduler=scheduler,
+                             streaming=args.streaming)
+        bill_list.export(run_report_path=None)
+    seconds = time.perf_counter() - start
+
+    counters = STATS.snapshot()['counters']
+    server = dict(standin.stats)
+    parse_hits = sum(n for name, n in counters.items() if name.startswith('parseCache.') and name.endswith('.hits'))
+    parse_misses = sum(n for name, n in counters.items() if name.startswith('parseCache.') and name.endswith('.misses'))
+    fetches = sum(counters.get(f'{kind}.fetches', 0) for kind in ['bill', 'floorVote', 'committeeVote'])
+    unchanged = counters.get('http.notModified', 0) + counters.get('http.unchangedBody', 0)
+    cache_reads = sum(counters.get(f'{kind}.cacheReads', 0) for kind in ['bill', 'floorVote', 'committeeVote'])
+    return {
+        'seconds': round(seconds, 3),
+        'stages': {name: round(stage, 3) for name, stage in STATS.snapshot()['stages'].items()},
+        'bills': counters.get('bills.listed', 0),
+        'billsRefreshed': counters.get('bills.needingRefresh', 0),
+        'requests': server.get('requests', 0),
+        'requestsPerSec': round(server.get('requests', 0) / seconds, 2),
+        'statuses': {name.split('.', 1)[1]: n for name, n in sorted(server.items()) if name.startswith('status.')},
+        'megabytes': round(server.get('bytes', 0) / 1e6, 2),
+        'retries': counters.get('http.retries', 0),
+        'injectedErrors': server.get('injectedErrors', 0),
+        'injectedMissingVotes': server.get('injectedMissingVotes', 0),
+        'cacheHitRatios': {
+            # Pages read from cache instead of requested, out of all pages the bills needed
+            'pages': ratio(cache_reads, fetches),
+            # Requests answered 304, or with a body identical to the cached one
+            'conditionalGets': ratio(unchanged, counters.get('http.requests', 0) - unchanged),
+            'parseCache': ratio(parse_hits, parse_misses),
+        },
+        'votesReusedFromOutput': counters.get('vote.reusedFromOutput', 0),
+        'knownMissingVotes': counters.get('floorVote.knownMissing', 0) + counters.get('committeeVote.knownMissing', 0),
+        'peakRssMb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                           / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end scrape load test against a local LAWS stand-in')
+    parser.add_argument('--runs', nargs='+', default=RUNS, choices=RUNS)
+    parser.add_argument('--bills', type=int, default=None, help='only scrape this many bills, for quick runs')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds the stand-in adds to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='up to this many more seconds, at random')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with a 503')
+    parser.add_argument('--missing-vote-rate', type=float, default=0.0, help='fraction of vote URLs served as missing')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--bill-workers', type=int, default=BILL_FETCH_WORKERS)
+    parser.add_argument('--vote-workers', type=int, default=VOTE_FETCH_WORKERS)
+    parser.add_argument('--retry-backoff', type=float, default=0.1,
+                        help='seconds before the first retry of a failed request')
+    parser.add_argument('--streaming', action='store_true')
+    parser.add_argument('--workdir', default=None,
+                        help='scratch directory to scrape into, kept afterwards (default: a temporary one)')
+    parser.add_argument('--output', default='load-test-results.json')
+    args = parser.parse_args()
+
+    standin = StandinServer(cache_base_path=abspath(CACHE_BASE_PATH), output_base_path=abspath(OUTPUT_BASE_PATH),
+                            latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                            missing_vote_rate=args.missing_vote_rate, bill_limit=args.bills, seed=args.seed).start()
+    output_path = abspath(args.output)
+    home = os.getcwd()
+    results = {}
+    with contextlib.ExitStack() as stack:
+        workdir = args.workdir or stack.enter_context(tempfile.TemporaryDirectory(prefix='load-test-'))
+        # Cache and output paths are relative, so the scrape writes into workdir
+        for path in [CACHE_BASE_PATH, OUTPUT_BASE_PATH]:
+            os.makedirs(os.path.join(workdir, path), exist_ok=True)
+        os.chdir(workdir)
+        stack.callback(os.chdir, home)
+        for run in args.runs:
+            result = results[run] = run_scrape(run, standin, args)
+            print(f"{run:<8} {result['bills']:>5} bills  {result['seconds']:>8.1f}s  "
+                  f"{result['requests']:>6} requests  {result['requestsPerSec']:>8.1f}/s  "
+                  f"page cache {result['cacheHitRatios']['pages'] or 0:.0%}  "
+                  f"304/unchanged {result['cacheHitRatios']['conditionalGets'] or 0:.0%}  "
+                  f"parse cache {result['cacheHitRatios']['parseCache'] or 0:.0%}  "
+                  f"retries {result['retries']}")
+    standin.stop()
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'session': SESSION_ID,
+            'options': {name: value for name, value in vars(args).items() if name not in ('output', 'workdir')},
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'results': results,
+    }
+    with open(output_path, 'w') as f:
+        json.dump(report, f, indent=4)
+    print('Written to', output_path)
+
+
+if __name__ == '__main__':
+    main()
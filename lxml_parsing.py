@@ -0,0 +1,87 @@
+"""
+Helpers for the lxml parser backend
+
+These mirror the BeautifulSoup calls used by the default parsers (find(text=...), find_parent,
+find_all, .text) over a plain lxml tree, so both backends extract identical values from the same
+HTML. tests/parser-equivalence.py checks that against the cached pages.
+
+lxml keeps text as element .text/.tail rather than separate nodes, so "strings" here are XPath
+text() results, which know their parent element and whether they're a tail.
+"""
+from lxml import etree
+
+FIRST_TEXT_EQUAL = etree.XPath('(.//text()[. = $value])[1]')
+FIRST_TEXT_CONTAINING = etree.XPath('(.//text()[contains(., $value)])[1]')
+
+
+def parse_html(text):
+    return etree.HTML(text)
+
+
+def find_text(node, value):
+    # Equivalent of node.find(text=value)
+    matches = FIRST_TEXT_EQUAL(node, value=value)
+    return matches[0] if matches else None
+
+
+def find_text_containing(node, value):
+    # Equivalent of node.find(text=re.compile(value)) for plain substrings
+    matches = FIRST_TEXT_CONTAINING(node, value=value)
+    return matches[0] if matches else None
+
+
+def string_parent(string):
+    # Element a text() result sits inside, same as NavigableString.parent
+    parent = string.getparent()
+    return parent.getparent() if string.is_tail else parent
+
+
+def find_string_parent(string, tag):
+    # Equivalent of string.find_parent(tag)
+    element = string_parent(string)
+    while element is not None and element.tag != tag:
+        element = element.getparent()
+    return element
+
+
+def find_parent(element, tag=None):
+    # Equivalent of tag.find_parent(tag), which starts above the element itself
+    element = element.getparent()
+    while tag is not None and element is not None and element.tag != tag:
+        element = element.getparent()
+    return element
+
+
+def children(element):
+    # Equivalent of iterating a Tag: text and child nodes interleaved, as bs4 sees them
+    nodes = [element.text] if element.text else []
+    for child in element:
+        nodes.append(child)
+        if child.tail:
+            nodes.append(child.tail)
+    return nodes
+
+
+def find(element, tag, **attributes):
+    # Equivalent of tag.find(tag, attributes), descendants only
+    for descendant in element.iterdescendants(tag):
+        if all(descendant.get(key) == value for key, value in attributes.items()):
+            return descendant
+    return None
+
+
+def find_all(element, tag):
+    return list(element.iterdescendants(tag))
+
+
+def next_element_sibling(element):
+    # Equivalent of tag.find_next_sibling(), which skips text and comments
+    sibling = element.getnext()
+    while sibling is not None and not isinstance(sibling.tag, str):
+        sibling = sibling.getnext()
+    return sibling
+
+
+def text(element):
+    # Equivalent of tag.text
+    return ''.join(element.itertext())
@@ -0,0 +1,8 @@
+# Merges a finished sharded scrape of the current session (see sharding.py and scrape-shard.py)
+# into the same cache state and output files a single scrape would have written
+# Run as `python3 merge-shards.py COUNT` once every one of the COUNT shards has finished
+import sys
+
+from sharding import merge_shards
+
+merge_shards(int(sys.argv[1]))
@@ -0,0 +1,31 @@
+# Copies a session's cached bill pages, votes, text sidecars and response metadata between cache store backends
+# Run as `python3 migrate-cache.py [session] [packed|directory]`, e.g. `python3 migrate-cache.py 20231 packed`
+# to pack cache/20231/bills and cache/20231/votes into cache/20231/cache-store.sqlite.
+# The source is left in place, set CACHE_STORE_BACKEND in config.py to switch to the new copy
+import os
+import sys
+
+if len(sys.argv) > 1:
+    os.environ['LAWS_SESSION_ID'] = sys.argv[1]
+target = sys.argv[2] if len(sys.argv) > 2 else 'packed'
+
+from config import CACHE_BASE_PATH
+
+from cache_store import get_cache_store
+
+CACHED_DIRECTORIES = ['bills', 'votes']
+
+source = get_cache_store(
+    CACHE_BASE_PATH, 'directory' if target == 'packed' else 'packed')
+destination = get_cache_store(CACHE_BASE_PATH, target)
+
+for directory in CACHED_DIRECTORIES:
+    keys = source.keys(directory)
+    print(f'Copying {len(keys)} entries from {directory}/ to {target} store')
+    for key in keys:
+        raw = source.read(key)
+        destination.write(key, raw)
+        if destination.read(key) != raw:
+            sys.exit(f'Mismatch after copying {key}')
+
+destination.close()
@@ -1,28 +1,65 @@
 import json
+import logging
 import re
-import requests
+from collections import deque
 from bs4 import BeautifulSoup
-from os.path import exists, join
+from os.path import join
 
-from models.bill_action import BillAction
+from models.slotted import PicklableSlots
+from models.bill_action import BillAction, export_identity, is_unchanged, make_action_id, parse_action_row, parse_action_row_lxml, row_identity
 
-from config import SESSION_ID, CACHE_BASE_PATH
+from config import SESSION_ID, CACHE_BASE_PATH, PARSER_BACKEND
 
 from functions import make_bill_key
 
+from fetch import SERIAL_SCHEDULER
+from cache_store import get_cache_store
+from instrumentation import STATS
 
-class Bill:
+import lxml_parsing as lx
+
+# Bump when parse_bill_html output changes, to invalidate its parse cache entries
+BILL_PARSER_VERSION = 2
+
+log = logging.getLogger(__name__)
+
+
+def bill_cache_path(key):
+    # Cache store key for a bill's page, e.g. 'bills/HB 1.html'
+    return join('bills', f'{key}.html')
+
+
+class Bill(PicklableSlots):
     """
     Data structure for Montana Legislature bill
 
     - needs_refresh - flag for determining whether bill needs new data freshed, vs. falling back to cached HTML
     - write_cache - flag for whether newly fetched bill HTML is written to cache
     - fetch_actions - flag for whether to fetch bill actions (for faster development)
-    - use_verbose_logging - flag for loquacious console messages 
+    - use_verbose_logging - passed along to actions and votes; per-bill messages are logged at DEBUG, see instrumentation.configure_logging
+    - scheduler - FetchScheduler that bill page and vote downloads go through
+    - parse_cache - ParseCache for bill page and vote parser output, None to always parse
+    - missing_votes - MissingVoteIndex of vote pages that failed to fetch, None to skip uncached votes for bills that don't need a refresh
+    - parser_backend - 'bs4' or 'lxml' (faster, same output) for parsing bill pages and floor votes
+    - previous_actions/previous_votes - actions and votes exported for this bill by the last scrape
+
+    Action rows are matched to previously exported actions by content (see row_identity) rather than
+    position. Unchanged actions are carried forward with their votes, so only new or modified rows
+    get built, and only their votes read and parsed.
+
+    Votes are built lazily by each BillAction, resolve_votes builds any outstanding ones concurrently
+
+    Bills, actions and votes use __slots__ to keep per-object overhead down for whole-session scrapes
 
     """
 
-    def __init__(self, input, needs_refresh=True, write_cache=True, fetch_actions=True, use_verbose_logging=True, cache_base_path=CACHE_BASE_PATH):
+    __slots__ = ('key', 'urlKey', 'url', 'needs_refresh', 'write_cache', 'use_verbose_logging',
+                 'fetch_actions', 'scheduler', 'parse_cache', 'parser_backend', 'missing_votes',
+                 'previous_actions', 'previous_votes', 'actions', 'data')
+
+    def __init__(self, input, needs_refresh=True, write_cache=True, fetch_actions=True, use_verbose_logging=True, cache_base_path=CACHE_BASE_PATH,
+                 scheduler=SERIAL_SCHEDULER, parse_cache=None, parser_backend=PARSER_BACKEND,
+                 previous_actions=None, previous_votes=None, missing_votes=None):
         self.key = input['key']
         self.urlKey = make_bill_key(input['key'])
         self.url = input['billPageUrl']
@@ -32,12 +69,17 @@ class Bill:
 
         self.use_verbose_logging = use_verbose_logging
         self.fetch_actions = fetch_actions
+        self.scheduler = scheduler
+        self.parse_cache = parse_cache
+        self.parser_backend = parser_backend
+        self.missing_votes = missing_votes
+        self.previous_actions = previous_actions or []
+        self.previous_votes = previous_votes or []
 
-        BILL_CACHE_PATH = join(cache_base_path, 'bills', f'{self.key}.html')
+        store = get_cache_store(cache_base_path)
+        BILL_CACHE_PATH = bill_cache_path(self.key)
 
-        if use_verbose_logging:
-            print(
-                f'\n## {self.key} - (Fetching new data: {self.needs_refresh})')
+        log.debug('\n## %s - (Fetching new data: %s)', self.key, self.needs_refresh)
 
         # Use input as starting point for building out bill data
         self.data = {
@@ -55,34 +97,47 @@ class Bill:
             'lastAction': input['lastAction'],
         }
 
-        if not self.needs_refresh and exists(BILL_CACHE_PATH):
-            if self.use_verbose_logging:
-                print(f'- Reading {self.key} data from {BILL_CACHE_PATH}')
-            with open(BILL_CACHE_PATH) as f:
-                text = f.read()
+        if not self.needs_refresh and store.exists(BILL_CACHE_PATH):
+            log.debug('- Reading %s data from %s', self.key, BILL_CACHE_PATH)
+            STATS.count('bill.cacheReads')
+            text = store.read_text(BILL_CACHE_PATH)
         else:
-            if self.use_verbose_logging:
-                print(f'+ Fetching {self.key} data from', self.url)
-            r = requests.get(self.url)
+            log.debug('+ Fetching %s data from %s', self.key, self.url)
+            STATS.count('bill.fetches')
+            r = self.scheduler.get(
+                self.url, cache_path=BILL_CACHE_PATH, store=store)
             text = r.text
             if self.write_cache:
-                if self.use_verbose_logging:
-                    print(f'o Writing {self.key} to cache',
-                          BILL_CACHE_PATH)
-                with open(BILL_CACHE_PATH, 'w') as f:
-                    f.write(text)
+                log.debug('o Writing %s to cache %s', self.key, BILL_CACHE_PATH)
+                self.scheduler.store(r, BILL_CACHE_PATH, store=store)
 
         # Parse HTML to populate bill data whether coming from fresh fetch or cache
         # Doing it like this so data structure tweaks don't necessitate deleting the cache
         # and re-fetching the entire bill corpus from scratch
-        self.parse_bill_html(text)
+        parse_html = self.parse_bill_html_lxml if self.parser_backend == 'lxml' else self.parse_bill_html
+
+        def parse():
+            with STATS.timer('parse.bill'):
+                return parse_html(text)
+        if self.parse_cache:
+            parsed = self.parse_cache.get_or_parse(
+                'bill', BILL_PARSER_VERSION, text.encode('utf-8'), parse)
+        else:
+            parsed = parse()
+        self.data.update(parsed['data'])
+
+        if self.fetch_actions:
+            self.build_actions(parsed['actionRows'])
 
-    def parse_bill_html(self, text):
+    @staticmethod
+    def parse_bill_html(text):
         """
         Parses bill page information
 
+        Returns bill data fields plus raw action table rows, as plain data that can go in the parse cache
         """
         soup = BeautifulSoup(text, 'lxml')
+        data = {}
 
         # Assume most high-level information has been picked up by bill list scraper
         # and will be more current from there
@@ -90,7 +145,7 @@ class Bill:
         bill_status_parent = soup.find(
             text="Current Bill Progress: ").find_parent('font')
         bill_status = [t for t in bill_status_parent][1].strip()
-        self.data['billStatus'] = bill_status
+        data['billStatus'] = bill_status
 
         fiscal_notes_tag = soup.find(
             text="Fiscal Note(s)")
@@ -98,7 +153,7 @@ class Bill:
             fiscal_notes_link = fiscal_notes_tag.find_parent('a')['href']
         else:
             fiscal_notes_link = None
-        self.data['fiscalNotesListUrl'] = fiscal_notes_link
+        data['fiscalNotesListUrl'] = fiscal_notes_link
 
         legal_note_tag = soup.find(
             text="Legal Review Note")
@@ -106,7 +161,7 @@ class Bill:
             legal_note_link = legal_note_tag.find_parent('a')['href']
         else:
             legal_note_link = None
-        self.data['legalNoteUrl'] = legal_note_link
+        data['legalNoteUrl'] = legal_note_link
 
         bill_amendments_tag = soup.find(
             text="Associated Amendments")
@@ -114,7 +169,7 @@ class Bill:
             bill_amendments_link = bill_amendments_tag.find_parent('a')['href']
         else:
             bill_amendments_link = None
-        self.data['amendmentListUrl'] = bill_amendments_link
+        data['amendmentListUrl'] = bill_amendments_link
 
         # Bill sponsors
         sponsor_table = soup.find(
@@ -124,9 +179,9 @@ class Bill:
             cells = [td.text for td in row.find_all('td')]
             sponsor_table_data[cells[0]] = " ".join(
                 [cells[2], cells[1]]).replace('&nbsp', '').strip()
-        self.data['draftRequestor'] = sponsor_table_data.get('Requestor')
-        self.data['billRequestor'] = sponsor_table_data.get('By Request Of')
-        self.data['primarySponsor'] = sponsor_table_data.get('Primary Sponsor')
+        data['draftRequestor'] = sponsor_table_data.get('Requestor')
+        data['billRequestor'] = sponsor_table_data.get('By Request Of')
+        data['primarySponsor'] = sponsor_table_data.get('Primary Sponsor')
 
         # Bill subjects
         subject_table = soup.find(
@@ -139,8 +194,8 @@ class Bill:
                 'fiscalCode': cells[1].replace('&nbsp', ''),
                 'voteReq': cells[2],
             })
-        self.data['subjects'] = subjects
-        self.data['voteRequirements'] = list(
+        data['subjects'] = subjects
+        data['voteRequirements'] = sorted(
             set([s['voteReq'] for s in subjects]))
 
         additional_bill_info_table = soup.find(
@@ -154,24 +209,132 @@ class Bill:
         transmittal_deadline = search_table("Transmittal Date:")
         amended_return_deadline = search_table(
             "Return (with 2nd house amendments) Date:")
-        self.data['deadlineCategory'] = deadline_category
-        self.data['transmittalDeadline'] = transmittal_deadline
-        self.data['amendedReturnDeadline'] = amended_return_deadline
+        data['deadlineCategory'] = deadline_category
+        data['transmittalDeadline'] = transmittal_deadline
+        data['amendedReturnDeadline'] = amended_return_deadline
 
-        # print(json.dumps(self.data, indent=4))
+        # print(json.dumps(data, indent=4))
 
         actions_table = soup.find(
             'a', {"name": "ba_table"}).find_parent().find('table')
+        action_rows = [parse_action_row(tr)
+                       for tr in actions_table.find_all('tr')[1:][::-1]]
 
-        if self.fetch_actions:
-            self.actions = [BillAction(
-                tr=tr,
+        return {
+            'data': data,
+            'actionRows': action_rows,
+        }
+
+    @staticmethod
+    def parse_bill_html_lxml(text):
+        """
+        lxml backend equivalent of parse_bill_html
+
+        Skips building a BeautifulSoup tree, which is most of the cost of parsing a bill page
+        """
+        root = lx.parse_html(text)
+        data = {}
+
+        bill_status_parent = lx.find_string_parent(
+            lx.find_text(root, "Current Bill Progress: "), 'font')
+        bill_status = lx.children(bill_status_parent)[1].strip()
+        data['billStatus'] = bill_status
+
+        def linked_url(label):
+            tag = lx.find_text(root, label)
+            return lx.find_string_parent(tag, 'a').get('href') if tag is not None else None
+
+        data['fiscalNotesListUrl'] = linked_url("Fiscal Note(s)")
+        data['legalNoteUrl'] = linked_url("Legal Review Note")
+        data['amendmentListUrl'] = linked_url("Associated Amendments")
+
+        def anchored_table(name):
+            return lx.find(lx.find_parent(lx.find(root, 'a', name=name)), 'table')
+
+        # Bill sponsors
+        sponsor_table_data = {}
+        for row in lx.find_all(anchored_table('spon_table'), 'tr')[1:]:
+            cells = [lx.text(td) for td in lx.find_all(row, 'td')]
+            sponsor_table_data[cells[0]] = " ".join(
+                [cells[2], cells[1]]).replace('&nbsp', '').strip()
+        data['draftRequestor'] = sponsor_table_data.get('Requestor')
+        data['billRequestor'] = sponsor_table_data.get('By Request Of')
+        data['primarySponsor'] = sponsor_table_data.get('Primary Sponsor')
+
+        # Bill subjects
+        subjects = []
+        for row in lx.find_all(anchored_table('subj_table'), 'tr')[1:]:
+            cells = [lx.text(td) for td in lx.find_all(row, 'td')]
+            subjects.append({
+                'subject': cells[0],
+                'fiscalCode': cells[1].replace('&nbsp', ''),
+                'voteReq': cells[2],
+            })
+        data['subjects'] = subjects
+        data['voteRequirements'] = sorted(
+            set([s['voteReq'] for s in subjects]))
+
+        additional_bill_info_table = anchored_table('abi_table')
+
+        def search_table(label):
+            label_cell = lx.find_string_parent(
+                lx.find_text(additional_bill_info_table, label), 'td')
+            return lx.text(lx.next_element_sibling(label_cell))
+
+        data['deadlineCategory'] = search_table("Category:")
+        data['transmittalDeadline'] = search_table("Transmittal Date:")
+        data['amendedReturnDeadline'] = search_table(
+            "Return (with 2nd house amendments) Date:")
+
+        action_rows = [parse_action_row_lxml(tr)
+                       for tr in lx.find_all(anchored_table('ba_table'), 'tr')[1:][::-1]]
+
+        return {
+            'data': data,
+            'actionRows': action_rows,
+        }
+
+    def build_actions(self, action_rows):
+        # Previous actions by identity, in table order so repeated identical rows pair up in order
+        votes_by_id = {vote['action_id']: vote for vote in self.previous_votes}
+        previous = {}
+        for action in self.previous_actions:
+            vote = votes_by_id.get(action['id']) if action['hasVote'] else None
+            previous.setdefault(export_identity(action, vote), deque()).append((action, vote))
+
+        self.actions = []
+        for i, row in enumerate(action_rows):
+            action_id = make_action_id(self.key, i)
+            candidates = previous.get(row_identity(row))
+            match = candidates.popleft() if candidates else None
+            if match and is_unchanged(row, *match):
+                STATS.count('action.carriedForward')
+                self.actions.append(BillAction.from_export(*match, action_id))
+                continue
+            STATS.count('action.built')
+            self.actions.append(BillAction(
+                row=row,
                 bill_key=self.key,
                 action_key=i,
                 bill_needs_refresh=self.needs_refresh,
                 use_verbose_logging=self.use_verbose_logging,
-            )
-                for i, tr in enumerate(actions_table.find_all('tr')[1:][::-1])]
+                scheduler=self.scheduler,
+                parse_cache=self.parse_cache,
+                parser_backend=self.parser_backend,
+                missing_votes=self.missing_votes,
+                previous_vote=match[1] if match else None,
+            ))
+        # Actions hold on to what they need from the last export
+        self.previous_actions = []
+        self.previous_votes = []
+
+    def resolve_votes(self):
+        """
+        Builds every action's vote now rather than on first use, on the scheduler's vote pool
+        since that's where vote fetches happen
+        """
+        if self.fetch_actions:
+            self.scheduler.map_votes(lambda action: action.get_vote(), self.actions)
 
     def export_actions(self):
         if self.fetch_actions:
@@ -1,64 +1,183 @@
 import json
+import logging
 
-from config import SESSION_ID, BASE_URL
+from config import SESSION_ID, BASE_URL, PARSER_BACKEND
 
+from models.slotted import PicklableSlots
 from models.vote import Vote
 
+from fetch import SERIAL_SCHEDULER
+from instrumentation import STATS
 
-class BillAction:
+import lxml_parsing as lx
+
+log = logging.getLogger(__name__)
+
+
+def parse_action_row(tr):
+    """
+    Pulls raw cell contents from a bill page actions table row
+
+    Kept separate from BillAction so rows can be cached as plain data
+    """
+    tds = tr.find_all('td')
+    return {
+        'action': tds[0].text,
+        'actionUrl': tds[0].get('href'),
+        'date': tds[1].text,
+        'yeas': tds[2].text,
+        'nays': tds[3].text,
+        'voteUrl': tds[2].find('a').get('href') if tds[2].find('a') else None,
+        'committee': tds[4].text,
+        'recordings': [a.get('href') for a in tds[4].find_all(
+            'a') if a.get('href') is not None and 'sg001-harmony.sliq.net' in a.get('href')],
+    }
+
+
+def parse_action_row_lxml(tr):
+    """
+    lxml backend equivalent of parse_action_row
+    """
+    tds = lx.find_all(tr, 'td')
+    vote_link = lx.find(tds[2], 'a')
+    return {
+        'action': lx.text(tds[0]),
+        'actionUrl': tds[0].get('href'),
+        'date': lx.text(tds[1]),
+        'yeas': lx.text(tds[2]),
+        'nays': lx.text(tds[3]),
+        'voteUrl': vote_link.get('href') if vote_link is not None else None,
+        'committee': lx.text(tds[4]),
+        'recordings': [a.get('href') for a in lx.find_all(
+            tds[4], 'a') if a.get('href') is not None and 'sg001-harmony.sliq.net' in a.get('href')],
+    }
+
+
+def make_action_id(bill_key, action_key):
+    return f"{bill_key.replace(' ', '')}-{action_key:04}"
+
+
+def renumber_vote(vote, action_id):
+    return vote if vote['action_id'] == action_id else dict(vote, action_id=action_id)
+
+
+def row_has_vote(row):
+    return (row['yeas'] != '&nbsp') and (row['nays'] != '&nbsp')
+
+
+def clean_committee(raw):
+    return raw.replace('&nbsp', '') if raw != '&nbsp' else None
+
+
+def classify_vote(row):
+    """
+    Returns vote URL, vote type and bill page vote count for an action row with a vote
+    """
+    action_description = row['action']
+    vote_count = {
+        'Y': int(row['yeas']),
+        'N': int(row['nays'])
+    }
+    total_votes = vote_count['Y'] + vote_count['N']
+    vote_url = row['voteUrl']
+
+    if vote_url is None:
+        # Guess at vote category based on number of votes
+        if 'Veto Override' in action_description:
+            vote_type = 'veto override'
+        elif (total_votes > 40):
+            vote_type = 'floor'
+        else:
+            vote_type = 'committee'
+    elif 'leg.mt.gov' in vote_url:
+        # committee vote
+        vote_type = 'committee'
+    elif 'LAW0211W$BLAC' in vote_url:
+        vote_type = 'floor'
+        vote_url = BASE_URL + vote_url
+    else:
+        log.error('Error, bad vote sorting algorithm: %s', vote_url)
+
+    return vote_url, vote_type, vote_count
+
+
+def row_identity(row):
+    """
+    Identifies an action independently of its position in the bill's action table
+    """
+    vote_url = classify_vote(row)[0] if row_has_vote(row) else None
+    return (row['action'], row['date'], clean_committee(row['committee']), vote_url)
+
+
+def export_identity(action, vote):
+    """
+    row_identity equivalent for an exported action and its exported vote (None if it has none)
+    """
+    return (action['action'], action['date'], action['committee'], vote['url'] if vote else None)
+
+
+def is_unchanged(row, action, vote):
+    """
+    Whether an action row matching a previously exported action (by row_identity) would export
+    the same action, and its vote can be reused as-is. Votes with no vote page also need the
+    same bill page yea/nay counts, since that's where their totals come from
+    """
+    if action['actionUrl'] != row['actionUrl'] or action['recordings'] != row['recordings']:
+        return False
+    if not row_has_vote(row):
+        return not action['hasVote']
+    _, vote_type, vote_count = classify_vote(row)
+    return (action['hasVote'] and vote is not None and vote.get('error') is None
+            and vote['type'] == vote_type
+            and (vote['url'] is not None or vote.get('totals') == vote_count))
+
+
+class BillAction(PicklableSlots):
     """
     Data structure for bill action
 
     Some but not all actions have associated votes
 
+    - row - raw action table cells, from parse_action_row
     - bill_needs_refresh - flag for whether parent bill needs a data refresh in current scrape
+    - previous_vote - this action's vote as exported by the last scrape, if any
+
+    The action's Vote isn't built until get_vote() is called. If the previous export has an
+    error-free vote for the same vote URL and type, that's used as-is instead of reading and
+    parsing the vote page again. Votes with no URL are only reused if the bill page still has
+    the same yea/nay counts, since that's where their totals come from.
+
+    Actions that haven't changed since the last export can be carried forward whole with from_export.
 
     TODO - use bill_needs_refresh flag to be smarter about whether votes need to be fetched
 
 
     """
 
-    def __init__(self, tr, bill_key, action_key, bill_needs_refresh=True, use_verbose_logging=False):
+    __slots__ = ('bill_needs_refresh', 'use_verbose_logging', 'scheduler', 'parse_cache',
+                 'parser_backend', 'missing_votes', 'has_vote', 'vote_inputs', 'previous_vote',
+                 'vote', 'data')
+
+    def __init__(self, row, bill_key, action_key, bill_needs_refresh=True, use_verbose_logging=False,
+                 scheduler=SERIAL_SCHEDULER, parse_cache=None, parser_backend=PARSER_BACKEND,
+                 previous_vote=None, missing_votes=None):
         self.bill_needs_refresh = bill_needs_refresh
         self.use_verbose_logging = use_verbose_logging
+        self.scheduler = scheduler
+        self.parse_cache = parse_cache
+        self.parser_backend = parser_backend
+        self.missing_votes = missing_votes
 
-        bill_key_ns = bill_key.replace(' ', '')
-        action_id = f'{bill_key_ns}-{action_key:04}'
+        action_id = make_action_id(bill_key, action_key)
 
-        tds = tr.find_all('td')
+        action_description = row['action']
+        action_date = row['date']
 
-        action_description = tds[0].text
-        action_date = tds[1].text
-
-        self.has_vote = (tds[2].text != '&nbsp') and (tds[3].text != '&nbsp')
+        self.has_vote = row_has_vote(row)
 
         if self.has_vote:
-            vote_count = {
-                'Y': int(tds[2].text),
-                'N': int(tds[3].text)
-            }
-            total_votes = vote_count['Y'] + vote_count['N']
-            vote_url = tds[2].find('a').get(
-                'href') if tds[2].find('a') else None
-
-            if vote_url is None:
-                # Guess at vote category based on number of votes
-                if 'Veto Override' in action_description:
-                    vote_type = 'veto override'
-                elif (total_votes > 40):
-                    vote_type = 'floor'
-                else:
-                    vote_type = 'committee'
-            elif 'leg.mt.gov' in vote_url:
-                # committee vote
-                vote_type = 'committee'
-            elif 'LAW0211W$BLAC' in vote_url:
-                vote_type = 'floor'
-                vote_url = BASE_URL + vote_url
-            else:
-                print('Error, bad vote sorting algorithm')
-
-            self.vote = Vote({
+            vote_url, vote_type, vote_count = classify_vote(row)
+            self.vote_inputs = {
                 'url': vote_url,
                 'bill': bill_key,
                 'action_id': action_id,
@@ -66,37 +185,79 @@ class BillAction:
                 'action_date': action_date,
                 'type': vote_type,
                 'bill_page_vote_count': vote_count,
-            },
-                bill_needs_refresh=self.bill_needs_refresh,
-                use_verbose_logging=self.use_verbose_logging
-            )
+            }
         else:
-            self.vote = None
+            self.vote_inputs = None
+        self.previous_vote = previous_vote
+        self.vote = None
 
-        committee = tds[4].text.replace(
-            '&nbsp', '') if tds[4].text != '&nbsp' else None
-        recordings = [a.get('href') for a in tds[4].find_all(
-            'a') if a.get('href') is not None and 'sg001-harmony.sliq.net' in a.get('href')]
+        committee = clean_committee(row['committee'])
 
         self.data = {
             'id': action_id,
             'bill': bill_key,
             'session': SESSION_ID,
             'action': action_description,
-            'actionUrl': tds[0].get('href'),
+            'actionUrl': row['actionUrl'],
             'date': action_date,
             'hasVote': self.has_vote,
             # 'voteType': vote_type,
             # 'voteUrl': vote_url,
             # 'voteCount': vote_count,
             'committee': committee,
-            'recordings': recordings,
+            'recordings': row['recordings'],
         }
 
         # print(json.dumps(self.data, indent=4))
 
+    @classmethod
+    def from_export(cls, data, vote_data, action_id):
+        """
+        Carries forward an action and its vote (or None) from the last export, renumbered to
+        action_id if earlier rows have been added or removed since
+        """
+        action = cls.__new__(cls)
+        action.bill_needs_refresh = False
+        action.use_verbose_logging = False
+        action.scheduler = SERIAL_SCHEDULER
+        action.parse_cache = None
+        action.parser_backend = PARSER_BACKEND
+        action.missing_votes = None
+        action.has_vote = data['hasVote']
+        action.vote_inputs = None
+        action.previous_vote = None
+        action.data = data if data['id'] == action_id else dict(data, id=action_id)
+        action.vote = Vote.from_export(renumber_vote(vote_data, action_id)) if vote_data else None
+        return action
+
     def get_vote(self):
+        """
+        Returns the action's Vote, building it on first use, or None if the action has no vote
+        """
+        if self.vote is None and self.vote_inputs is not None:
+            self.vote = self.build_vote()
+            self.previous_vote = None
         return self.vote
 
+    def build_vote(self):
+        inputs = self.vote_inputs
+        previous = self.previous_vote
+        if (previous is not None
+                and previous.get('error') is None
+                and previous['url'] == inputs['url']
+                and previous['type'] == inputs['type']
+                # Votes without a vote page take their totals from the bill page, which can change
+                and (inputs['url'] is not None or previous.get('totals') == inputs['bill_page_vote_count'])):
+            STATS.count('vote.reusedFromOutput')
+            return Vote.from_export(renumber_vote(previous, inputs['action_id']))
+        return Vote(inputs,
+                    bill_needs_refresh=self.bill_needs_refresh,
+                    use_verbose_logging=self.use_verbose_logging,
+                    scheduler=self.scheduler,
+                    parse_cache=self.parse_cache,
+                    parser_backend=self.parser_backend,
+                    missing_votes=self.missing_votes,
+                    )
+
     def export(self):
         return self.data
@@ -1,85 +1,521 @@
-# import json
-import requests
+import html
+import json
+import logging
 import re
+import time
 from bs4 import BeautifulSoup
-from datetime import date
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from datetime import datetime
+from functools import partial
 from os.path import exists, join
 
 
-from functions import write_json, read_json
+from functions import make_bill_key, write_json, read_json
+from json_stream import JsonArrayWriter, FORMAT_EXTENSIONS
 
-from models.bill import Bill
+from models.bill import Bill, bill_cache_path
+from models.vote import extract_committee_vote_texts
+from models.refresh_manifest import RefreshManifest
+from models.missing_vote_index import MissingVoteIndex
 
-from config import BASE_URL, CACHE_BASE_PATH, OUTPUT_BASE_PATH
+from fetch import FetchScheduler, SERIAL_SCHEDULER, STREAM_CHUNK_SIZE
+from parse_cache import ParseCache
+from cache_store import get_cache_store
+from output_store import OutputStore
+from vote_matrix import VoteMatrixWriter
+from change_feed import ChangeFeedWriter, CHANGE_FEED_DIRNAME
+from instrumentation import STATS, configure_logging
+import lxml_parsing as lx
+
+from config import SESSION_ID, BASE_URL, CACHE_BASE_PATH, OUTPUT_BASE_PATH, PARSER_BACKEND, COMBINED_EXPORT_FORMATS, COMBINED_EXPORT_GZIP, WRITE_OUTPUT_DATABASE, WRITE_VOTE_MATRIX, WRITE_CHANGE_FEED, SCRAPE_TIME_BUDGET_SECONDS
 
 BILL_LIST_HTML_CACHE_PATH = join(CACHE_BASE_PATH, 'all-introduced-bills.html')
 BILL_DATA_CACHE = join(CACHE_BASE_PATH, 'last-scrape-bill-data.json')
+REFRESH_MANIFEST_PATH = join(CACHE_BASE_PATH, 'refresh-manifest.json')
+MISSING_VOTES_PATH = join(CACHE_BASE_PATH, 'missing-votes.json')
+PARSE_CACHE_PATH = join(CACHE_BASE_PATH, 'parse-cache.sqlite')
+RUN_REPORT_PATH = join(CACHE_BASE_PATH, 'run-report.json')
+NAMES_REPORT_PATH = join(CACHE_BASE_PATH, 'unresolved-names.json')
 
 LAST_SCRAPE_BILLS_PATH = join(OUTPUT_BASE_PATH, 'all-bills.json')
+OUTPUT_DATABASE_FILENAME = 'laws.sqlite'
+VOTE_MATRIX_FILENAME = 'vote-matrix.npz'
+LAWMAKERS_FILENAME = 'lawmakers.json'
 # LAST_SCRAPE_ACTIONS_PATH = join(OUTPUT_BASE_PATH, 'all-bill-actions.json')
 # LAST_SCRAPE_VOTES_PATH = join(OUTPUT_BASE_PATH, 'all-votes.json')
 
-TODAY = date.today().strftime('%m/%d/%Y')
+
+log = logging.getLogger(__name__)
+
+# First header of the introduced bills table, the unintroduced drafts table below it has its own headers
+BILL_TABLE_FIRST_HEADER = 'Bill Type - Number'
+ROW_END = re.compile(r'</tr\s*>', re.IGNORECASE)
+TABLE_END = re.compile(r'</table\s*>', re.IGNORECASE)
+
+
+def split_rows(chunks):
+    """
+    Regroups streamed HTML text into pieces that each end with a </tr>, plus whatever trails the last one
+    """
+    pending = ''
+    for chunk in chunks:
+        pending += chunk
+        start = 0
+        for match in ROW_END.finditer(pending):
+            yield pending[start:match.end()]
+            start = match.end()
+        pending = pending[start:]
+    if pending:
+        yield pending
+
+# Per-process state for BillList.rebuild_in_processes workers
+worker_parse_cache = None
+worker_missing_votes = None
+worker_verbose_logging = False
+worker_parser_backend = PARSER_BACKEND
+
+
+def init_rebuild_worker(parse_cache_path, use_verbose_logging, parser_backend):
+    global worker_parse_cache, worker_missing_votes, worker_verbose_logging, worker_parser_backend
+    worker_parse_cache = ParseCache(
+        parse_cache_path) if parse_cache_path else None
+    worker_missing_votes = MissingVoteIndex(MISSING_VOTES_PATH, offline=True)
+    worker_verbose_logging = use_verbose_logging
+    worker_parser_backend = parser_backend
+    configure_logging(use_verbose_logging)
+    STATS.reset()
+
+
+def rebuild_bill(raw):
+    bill = Bill(raw,
+                needs_refresh=False,
+                use_verbose_logging=worker_verbose_logging,
+                scheduler=SERIAL_SCHEDULER,
+                parse_cache=worker_parse_cache,
+                parser_backend=worker_parser_backend,
+                missing_votes=worker_missing_votes)
+    bill.resolve_votes()
+    if worker_parse_cache:
+        worker_parse_cache.flush()
+    # Stats go back with each bill, to be merged into the parent process's run report
+    stats = STATS.snapshot()
+    STATS.reset()
+    return bill, stats
+
+
+def next_scrape_bill_data(bills, deferred_keys, last_scrape_bills):
+    """
+    Bill data to plan the next scrape from. Bills whose refresh was deferred keep their data from
+    the last scrape (`last_scrape_bills`, by key), or are left out if it didn't have them, since
+    their new bill list row would make them look up to date, see RefreshManifest.plan_bill
+    """
+    bill_data = []
+    for bill in bills:
+        if bill.key not in deferred_keys:
+            bill_data.append(bill.export())
+        elif bill.key in last_scrape_bills:
+            bill_data.append(last_scrape_bills[bill.key])
+    return bill_data
 
 
 class BillList:
     """Data structure for gathering list of bills from LAWS system
 
-    Cache Logic: Import bills where either bill page "Status Date" or "Status" don't match cached version
-        OR where the date of the last status update is today.
+    Cache Logic: See RefreshManifest. Bill pages are fetched when their bill list row has changed
+        since their last fetch, or at most every few hours when the last status update is today.
+
+    - scheduler - FetchScheduler for bill page and vote downloads, defaults to concurrent limits from config.
+        A default scheduler is closed once the bills are built; pass one in to keep it, e.g. for refresh
+    - dry_run - plan the refresh without fetching or building bills, see print_refresh_plan
+    - use_parse_cache - flag for reusing parser output for bill/vote documents that haven't changed
+    - rebuild_from_cache - rebuild every bill from cached pages without refreshing any, e.g. after a parser change
+    - processes - worker processes to spread rebuild parsing across (rebuild_from_cache only)
+    - parser_backend - 'bs4' or 'lxml' for bill page and floor vote parsing
+    - reuse_previous_output - flag for carrying forward actions and votes that haven't changed since the
+        last export rather than rebuilding them (off when rebuilding from cache, since that's for picking up parser changes)
+    - streaming - build bills as export consumes them rather than all up front, so each is written out and
+        released before later ones are built and memory stays flat over the session. self.bills is then a
+        one-pass iterator, and the scrape's caches are saved when export reaches its end. Ignored by
+        multi-process rebuilds
+    - time_budget - seconds from the start of the scrape to spend refreshing bills, None for no limit.
+        Bills needing a refresh are fetched highest priority first (see RefreshManifest.priority) until
+        it runs out; the rest are deferred to the next scrape, see build_within_budget. Export comes
+        after, so leave room for it. Turns off streaming
+    - shard - sharding.Shard to only scrape that slice of the bill list, for one worker of a sharded
+        scrape. Scrape state (bill data, refresh manifest, missing votes, response metadata) is saved
+        to the shard's fragment directory rather than over the shared files, for merge_shards to combine
+
+    Vote pages that come back missing are tracked in a MissingVoteIndex and retried on a backoff
+        schedule, including for bills that don't need a refresh. Rebuilds from cache don't fetch them,
+        but label them with the errors recorded there, same as a scrape would.
+
+    Fetch, cache and parse counters and timings are collected in instrumentation.STATS and
+    written out as a run report by export.
 
     """
 
     def __init__(self, bill_list_url,
                  force_refresh=False,
                  use_html_bill_list_cache=False,
-                 use_verbose_logging=False):
-        bill_list = self.get_bill_list(
-            bill_list_url, use_cache=use_html_bill_list_cache)
+                 use_verbose_logging=False,
+                 scheduler=None,
+                 dry_run=False,
+                 use_parse_cache=True,
+                 rebuild_from_cache=False,
+                 processes=1,
+                 parser_backend=PARSER_BACKEND,
+                 reuse_previous_output=True,
+                 streaming=False,
+                 time_budget=SCRAPE_TIME_BUDGET_SECONDS,
+                 shard=None):
+        started = time.monotonic()
+        configure_logging(use_verbose_logging)
+        self.owns_scheduler = scheduler is None
+        self.scheduler = scheduler or FetchScheduler()
+        self.options = {
+            'forceRefresh': force_refresh,
+            'useHtmlBillListCache': use_html_bill_list_cache,
+            'dryRun': dry_run,
+            'useParseCache': use_parse_cache,
+            'rebuildFromCache': rebuild_from_cache,
+            'processes': processes,
+            'parserBackend': parser_backend,
+            'reusePreviousOutput': reuse_previous_output,
+            'streaming': streaming,
+            'timeBudget': time_budget,
+            'shard': shard.name if shard else None,
+        }
         self.use_verbose_logging = use_verbose_logging
+        self.parser_backend = parser_backend
+        self.reuse_previous_output = reuse_previous_output and not rebuild_from_cache
+        self.shard = shard
+        if shard is not None and not dry_run:
+            shard.clear_fragments()
 
         if exists(BILL_DATA_CACHE):
             self.last_scrape_bills = read_json(BILL_DATA_CACHE)
         else:
-            if use_verbose_logging:
-                print('No bill data cache found at', BILL_DATA_CACHE)
+            log.debug('No bill data cache found at %s', BILL_DATA_CACHE)
             self.last_scrape_bills = []
 
-        self.bills = []
+        self.manifest = RefreshManifest(REFRESH_MANIFEST_PATH,
+                                        last_scrape_bills=self.last_scrape_bills,
+                                        force_refresh=force_refresh)
+
+        # Rows are planned as they're parsed, filling in self.bill_list and self.refresh_plan
+        self.bill_list = []
+        self.refresh_plan = []
+        # Every listed key, a shard's own or not, for merge_shards to put shards' bills in list order
+        self.listed_keys = []
+        rows = self.iter_bill_list(bill_list_url, use_cache=use_html_bill_list_cache or rebuild_from_cache,
+                                   write_cache=not dry_run and (shard is None or shard.index == 0))
+        if shard is not None:
+            rows = self.shard_rows(rows)
+        planned_rows = self.plan_bill_list(rows, rebuild_from_cache)
+
+        if dry_run:
+            for _ in planned_rows:
+                pass
+            self.bills = []
+            self.close_scheduler()
+            return
+
+        if rebuild_from_cache and processes > 1:
+            bill_list = [raw for raw, _ in planned_rows]
+            self.parse_cache = None
+            self.missing_votes = None
+            with STATS.stage('build'):
+                self.bills = self.rebuild_in_processes(
+                    bill_list, processes, use_parse_cache)
+            for raw in bill_list:
+                self.manifest.record(raw, fetched=False)
+            self.finish_build([bill.export() for bill in self.bills])
+            self.close_scheduler()
+            return
+
+        self.parse_cache = ParseCache(
+            PARSE_CACHE_PATH) if use_parse_cache else None
+        self.missing_votes = MissingVoteIndex(MISSING_VOTES_PATH, offline=rebuild_from_cache)
+
+        if time_budget is not None and not rebuild_from_cache:
+            with STATS.stage('build'):
+                self.bills = self.build_within_budget(list(planned_rows), started + time_budget)
+            self.finish_build(next_scrape_bill_data(self.bills, self.deferred_keys, self.manifest.last_scrape_bills))
+            self.close_scheduler()
+            return
+
+        if streaming:
+            # The whole bill list is read before any bill is built, rather than as export pulls
+            # bills through, so the list download (and its host slot) isn't held open all scrape
+            self.bills = self.stream_bills(self.build_bill, list(planned_rows))
+            return
+
+        # Bills start building as their rows come in, and come back in bill list order
+        # regardless of which finish first
+        with STATS.stage('build'):
+            self.bills = self.scheduler.map_bills(self.build_bill, planned_rows)
+
+        self.finish_build([bill.export() for bill in self.bills])
+        self.close_scheduler()
+
+    def build_bill(self, planned, previous_output=None):
+        """
+        Builds a bill from its bill list row and refresh plan. `previous_output` is the bill's last
+        exported actions and votes as Bill keyword arguments, read from the output files if not given
+        """
+        raw, plan = planned
+        bill = Bill(raw,
+                    needs_refresh=plan['needsRefresh'],
+                    use_verbose_logging=self.use_verbose_logging,
+                    scheduler=self.scheduler,
+                    parse_cache=self.parse_cache,
+                    parser_backend=self.parser_backend,
+                    missing_votes=self.missing_votes,
+                    **(previous_output if previous_output is not None else self.read_previous_output(raw['key'])))
+        bill.resolve_votes()
+        if not plan.get('deferred'):
+            self.manifest.record(raw, fetched=plan['needsRefresh'])
+        return bill
+
+    def build_within_budget(self, planned_rows, deadline):
+        """
+        Builds bills needing a refresh in priority order until `deadline` (a time.monotonic() time)
+        passes, then the rest from cache. Returns bills in bill list order
+
+        Refreshes not started by the deadline are deferred: the bill is built from its cached page
+        and keeps its manifest entry as it was. Their keys go in self.deferred_keys, so they're
+        saved with the last scrape's bill data rather than their new bill list row (see
+        next_scrape_bill_data), and the next scrape plans and prioritizes them the same again.
+        Deferred bills with nothing cached yet are left out until then.
+        """
+        # Stable sort, so bills of equal priority keep bill list order
+        queue = iter(sorted((planned for planned in planned_rows if planned[1]['needsRefresh']),
+                            key=lambda planned: -planned[1]['priority']))
+
+        def until_deadline():
+            while time.monotonic() < deadline:
+                planned = next(queue, None)
+                if planned is None:
+                    return
+                yield planned
+
+        bills = {bill.key: bill for bill in self.scheduler.imap_bills(self.build_bill, until_deadline())}
+
+        store = get_cache_store(CACHE_BASE_PATH)
+        deferred = list(queue)
+        self.deferred_keys = {raw['key'] for raw, _ in deferred}
+        from_cache = [planned for planned in planned_rows if not planned[1]['needsRefresh']]
+        for raw, plan in deferred:
+            plan['deferred'] = True
+            if store.exists(bill_cache_path(raw['key'])):
+                from_cache.append((raw, {**plan, 'needsRefresh': False}))
+        if deferred:
+            STATS.count('bills.deferred', len(deferred))
+            print(f'Time budget reached after {len(bills)} bill refreshes, deferring {len(deferred)} to the next scrape')
+
+        for bill in self.scheduler.map_bills(self.build_bill, from_cache):
+            bills[bill.key] = bill
+        return [bills[raw['key']] for raw, _ in planned_rows if raw['key'] in bills]
+
+    def refresh(self, bill_list_url):
+        """
+        Brings an already built, non-streaming bill list up to date in place, for watch mode (see watch-session.py).
+        Needs a scheduler passed in to the constructor, since a default one is closed after the first build
+
+        The bill list is fetched again and replanned against the refresh manifest. Only bills that
+        need a refresh, are new to the list, or have a missing vote due for a retry are rebuilt,
+        with their in-memory actions and votes as previous output; every other bill keeps its
+        parsed Bill as is. An unchanged bill list (304 or identical body) isn't reparsed.
+
+        Returns the keys of rebuilt bills, for export(only_keys=...)
+        """
+        now = datetime.now()
+        self.manifest.set_time(now)
+        self.manifest.force_refresh = False
+        self.missing_votes.set_time(now)
+
+        with STATS.stage('billList'):
+            response = self.scheduler.get(bill_list_url, cache_path=BILL_LIST_HTML_CACHE_PATH)
+            if response.status_code != 200:
+                log.warning('Bill list fetch failed with HTTP %s, keeping the last one', response.status_code)
+                return []
+            if not (response.unchanged and self.bill_list):
+                self.bill_list = list(self.parse_bill_list([response.text]))
+            self.scheduler.store(response, BILL_LIST_HTML_CACHE_PATH)
+
+        current = {bill.key: bill for bill in self.bills}
+        self.refresh_plan = []
+        to_build = []
+        for raw in self.bill_list:
+            plan = self.manifest.plan_bill(raw)
+            self.refresh_plan.append(plan)
+            STATS.count('bills.listed')
+            STATS.count('bills.needingRefresh', int(plan['needsRefresh']))
+            bill = current.get(raw['key'])
+            if plan['needsRefresh'] or bill is None or self.has_missing_votes_due(bill):
+                to_build.append((raw, plan, bill))
+
+        def rebuild(item):
+            raw, plan, bill = item
+            previous_output = {'previous_actions': bill.export_actions(), 'previous_votes': bill.export_votes()} \
+                if bill is not None and self.reuse_previous_output else None
+            return self.build_bill((raw, plan), previous_output)
+
+        entries = dict(self.manifest.entries)
+        try:
+            with STATS.stage('build'):
+                rebuilt = {bill.key: bill for bill in self.scheduler.map_bills(rebuild, to_build)}
+        except Exception:
+            # Bills built before the failure are dropped too, so the manifest can't count them as fetched
+            self.manifest.entries = entries
+            raise
+        STATS.count('bills.rebuilt', len(rebuilt))
+
+        self.bills = [rebuilt.get(raw['key']) or current[raw['key']] for raw in self.bill_list]
+        self.finish_build([bill.export() for bill in self.bills])
+        return list(rebuilt)
+
+    def has_missing_votes_due(self, bill):
+        # Vote errors from the missing vote index whose URL is due for another try
+        return any(vote.get('error') and vote.get('url') and self.missing_votes.get(vote['url']) is not None
+                   and self.missing_votes.should_retry(vote['url'])
+                   for vote in bill.export_votes())
+
+    def stream_bills(self, build_bill, planned_rows):
+        """
+        Yields bills in bill list order as they're built, keeping only their bill data
+        for last-scrape-bill-data.json, then finishes the build once the last one's through.
+        `planned_rows` should already be read in full, only bill building is paced by export
+
+        Building overlaps with export here, so there's no separate build stage in the run report
+        """
+        bill_data = []
+        for bill in self.scheduler.imap_bills(build_bill, planned_rows):
+            bill_data.append(bill.export())
+            yield bill
+        self.finish_build(bill_data)
+        self.close_scheduler()
+
+    def close_scheduler(self):
+        # Shuts down the worker pools of a scheduler this bill list started, callers close their own
+        if self.owns_scheduler:
+            self.scheduler.close()
+
+    def finish_build(self, bill_data):
+        """
+        Saves what the next scrape plans from: bill data, refresh manifest, missing votes,
+        response metadata and parse cache. A shard saves all but the parse cache to its fragments
+        """
+        self.write_bill_data_cache(bill_data)
+        self.manifest.save(self.state_path(REFRESH_MANIFEST_PATH))
+        if self.missing_votes:
+            self.missing_votes.save(self.state_path(MISSING_VOTES_PATH))
+        if self.shard:
+            write_json(self.listed_keys, self.shard.bill_list_path, log=False)
+            self.scheduler.client.save(self.shard.response_meta_path)
+        else:
+            self.scheduler.client.save()
+        if self.parse_cache:
+            self.parse_cache.save()
+
+    def rebuild_in_processes(self, bill_list, processes, use_parse_cache):
+        """
+        Builds bills from cache across a process pool, returned in bill list order.
+
+        Parsing is CPU-bound, so this scales with cores where threads can't. Committee vote PDFs
+        get their text extracted as a separate batch first, see extract_committee_vote_texts.
+        """
+        with STATS.stage('extractCommitteeText'):
+            extract_committee_vote_texts(
+                get_cache_store(CACHE_BASE_PATH).keys('votes', '.pdf'), processes)
+
+        print(f'Rebuilding {len(bill_list)} bills from cache across {processes} processes')
+        parse_cache_path = PARSE_CACHE_PATH if use_parse_cache else None
+        with ProcessPoolExecutor(processes,
+                                 initializer=init_rebuild_worker,
+                                 initargs=(parse_cache_path, self.use_verbose_logging, self.parser_backend)) as pool:
+            bills = []
+            for bill, stats in pool.map(rebuild_bill, bill_list, chunksize=8):
+                STATS.merge(stats)
+                bills.append(bill)
+            return bills
+
+    def read_previous_output(self, key):
+        """
+        Returns a bill's actions and votes from the last export as Bill keyword arguments,
+        empty if there's nothing to reuse
+        """
+        previous = {'previous_actions': [], 'previous_votes': []}
+        if not self.reuse_previous_output:
+            return previous
+        for kwarg, suffix in [('previous_actions', 'actions'), ('previous_votes', 'votes')]:
+            path = join(OUTPUT_BASE_PATH, f'{make_bill_key(key)}--{suffix}.json')
+            if exists(path):
+                with open(path) as f:
+                    previous[kwarg] = json.load(f)
+        return previous
+
+    def print_refresh_plan(self):
+        reasons = {}
+        for plan in self.refresh_plan:
+            reasons[plan['reason']] = reasons.get(plan['reason'], 0) + 1
+            if plan['needsRefresh']:
+                print(f"+ {plan['key']} - {plan['reason']} (priority {plan['priority']}, last fetched: {plan['lastFetched']})")
+        print(f'\n{len(self.refresh_plan)} bills in list')
+        for reason, count in sorted(reasons.items(), key=lambda r: -r[1]):
+            print(f'- {reason}: {count}')
+
+    def shard_rows(self, bill_list):
+        """
+        Yields the rows in this scrape's shard, noting every row's key as it goes by
+        """
         for raw in bill_list:
-            matches = [
-                last for last in self.last_scrape_bills if last['key'] == raw['key']
-            ]
-            needs_refresh = force_refresh \
-                or len(matches) == 0 \
-                or (raw['statusDate'] != matches[0]['statusDate']) \
-                or (raw['lastAction'] != matches[0]['lastAction']) \
-                or (raw['statusDate'] == TODAY)
-            bill = Bill(raw,
-                        needs_refresh=needs_refresh,
-                        use_verbose_logging=self.use_verbose_logging)
-            self.bills.append(bill)
-
-        self.write_bill_data_cache()
-
-    def get_bill_list(self, list_url, use_cache=False, write_cache=True):
+            self.listed_keys.append(raw['key'])
+            if self.shard.includes(raw['key']):
+                yield raw
+
+    def plan_bill_list(self, bill_list, rebuild_from_cache=False):
+        """
+        Yields bill list rows paired with their refresh decisions, recording both as they go by
+        """
+        # The stage runs until the last row is planned, overlapping with bills already building
+        with STATS.stage('billList'):
+            for raw in bill_list:
+                if rebuild_from_cache:
+                    plan = {'key': raw['key'], 'needsRefresh': False,
+                            'reason': 'rebuild from cache', 'lastFetched': None}
+                else:
+                    plan = self.manifest.plan_bill(raw)
+                self.bill_list.append(raw)
+                self.refresh_plan.append(plan)
+                STATS.count('bills.listed')
+                STATS.count('bills.needingRefresh', int(plan['needsRefresh']))
+                yield raw, plan
+
+    def iter_bill_list(self, list_url, use_cache=False, write_cache=True):
+        """
+        Yields bill list rows as raw dicts. With the lxml backend, rows are parsed as the page is
+        read or downloaded, rather than after the whole thing has arrived
+        """
         if use_cache:
             print("Reading bill list from", BILL_LIST_HTML_CACHE_PATH)
             with open(BILL_LIST_HTML_CACHE_PATH, 'r') as f:
-                text = f.read()
-                parsed = self.parse_bill_list_html(text)
-                return parsed
+                yield from self.parse_bill_list(iter(partial(f.read, STREAM_CHUNK_SIZE), ''))
         else:
             print("Fetching bill list from", list_url)
-            r = requests.get(list_url)
-            text = r.text
+            response = self.scheduler.stream(
+                list_url, cache_path=BILL_LIST_HTML_CACHE_PATH)
+            yield from self.parse_bill_list(response)
             if write_cache:
                 print("Writing bill list to",
                       BILL_LIST_HTML_CACHE_PATH)
-                with open(BILL_LIST_HTML_CACHE_PATH, 'w') as f:
-                    f.write(text)
-            parsed = self.parse_bill_list_html(text)
-            return parsed
+                self.scheduler.store(response.result, BILL_LIST_HTML_CACHE_PATH)
+
+    def parse_bill_list(self, chunks):
+        if self.parser_backend == 'lxml':
+            return self.parse_bill_list_stream(chunks)
+        return self.parse_bill_list_html(''.join(chunks))
 
     def parse_bill_list_html(self, text):
         """
@@ -96,12 +532,46 @@ class BillList:
         bills = [self.parse_bill_row(node, headers) for node in rows[1:]]
         return bills
 
+    def parse_bill_list_stream(self, chunks):
+        """
+        Yields bill list rows as raw dicts from the page's HTML text as it comes in, parsing one
+        table row at a time with lxml. Same output as parse_bill_list_html
+
+        lxml's own incremental HTMLPullParser isn't used since libxml2 stalls on this page's
+        unquoted attributes until the whole document is in, see split_rows instead
+        """
+        headers = None
+        for piece in split_rows(chunks):
+            if TABLE_END.search(piece):
+                headers = None
+            root = lx.parse_html(piece)
+            if root is None:
+                continue
+            for node in root.iter('tr'):
+                header_cells = lx.find_all(node, 'th')
+                if header_cells:
+                    headers = [html.unescape(lx.text(th)) for th in header_cells]
+                elif headers and headers[0] == BILL_TABLE_FIRST_HEADER:
+                    yield self.parse_bill_row_lxml(node, headers)
+
+    def parse_bill_list_html_lxml(self, text):
+        return list(self.parse_bill_list_stream([text]))
+
     def parse_bill_row(self, node, keys):
         cells = [td.text for td in node.find_all('td')]
-        links = node.find_all('a', href=True)
-        bill_page_link = links[0]['href']
-        bill_html_link = links[1]['href']
-        bill_pdf_link = links[2]['href']
+        links = [a['href'] for a in node.find_all('a', href=True)]
+        return self.bill_from_row(cells, links, keys)
+
+    def parse_bill_row_lxml(self, node, keys):
+        # html.parser decodes entities missing their semicolons (the list's &nbsp&nbsp), lxml leaves them as is
+        cells = [html.unescape(lx.text(td)) for td in lx.find_all(node, 'td')]
+        links = [a.get('href') for a in lx.find_all(node, 'a') if a.get('href') is not None]
+        return self.bill_from_row(cells, links, keys)
+
+    def bill_from_row(self, cells, links, keys):
+        bill_page_link = links[0]
+        bill_html_link = links[1]
+        bill_pdf_link = links[2]
         raw = {}
         for i, key in enumerate(keys):
             raw[key] = cells[i]
@@ -109,10 +579,9 @@ class BillList:
 
         # Log consistent bug popping up on LAWS list
         if ("Party/District Not Assigned" in sponsor_raw):
-            print(f'Bill list bug; "{sponsor_raw}"')
+            log.warning('Bill list bug; "%s"', sponsor_raw)
 
         # Temporary hack for LAWS-side bug
-        print(sponsor_raw)
         if sponsor_raw == "Sara  Hess Party/District Not Assigned":
             sponsor_district = "HD 69"
             sponsor_party = "R"
@@ -139,36 +608,115 @@ class BillList:
         }
         return bill
 
-    def write_bill_data_cache(self):
-        bill_list = []
-        for bill in self.bills:
-            bill_data = bill.export()
-            bill_list.append(bill_data)
-        write_json(bill_list, BILL_DATA_CACHE)
-
-    def export(self):
-        bill_list = []
-        action_list = []
-        vote_list = []
-        for bill in self.bills:
-
-            bill_data = bill.export()
-            write_json(bill_data, join(
-                OUTPUT_BASE_PATH, f'{bill.urlKey}--data.json'), log=False)
-            bill_list.append(bill_data)
-
-            actions = bill.export_actions()
-            write_json(actions, join(
-                OUTPUT_BASE_PATH, f'{bill.urlKey}--actions.json'), log=False)
-            action_list.extend(actions)
-
-            votes = bill.export_votes()
-            write_json(votes, join(
-                OUTPUT_BASE_PATH, f'{bill.urlKey}--votes.json'), log=False)
-            vote_list.extend(votes)
-
-        # Write combined files
-        write_json(bill_list, join(OUTPUT_BASE_PATH, 'all-bills.json'))
-        write_json(action_list, join(
-            OUTPUT_BASE_PATH, 'all-bill-actions.json'))
-        write_json(vote_list, join(OUTPUT_BASE_PATH, 'all-votes.json'))
+    def write_bill_data_cache(self, bill_data):
+        write_json(bill_data, self.state_path(BILL_DATA_CACHE))
+
+    def state_path(self, path):
+        # Where a scrape state file is saved, the shard's copy for one shard of a sharded scrape
+        return self.shard.path_for(path) if self.shard else path
+
+    def export(self, formats=COMBINED_EXPORT_FORMATS, gzip=COMBINED_EXPORT_GZIP, write_database=WRITE_OUTPUT_DATABASE,
+               write_vote_matrix=WRITE_VOTE_MATRIX, output_base_path=OUTPUT_BASE_PATH, run_report_path=RUN_REPORT_PATH,
+               names_report_path=NAMES_REPORT_PATH, only_keys=None, write_change_feed=WRITE_CHANGE_FEED):
+        """
+        Writes per-bill and combined output files, leaving files whose contents haven't changed alone
+
+        Combined files are streamed out bill by bill rather than assembled in memory first,
+        in each of `formats` (see json_stream.FORMAT_EXTENSIONS), plus .gz copies if `gzip`
+
+        With `write_database`, changed bills are also updated in the SQLite output database
+
+        With `write_vote_matrix`, name-by-name votes also go in a columnar vote matrix, with the lawmaker roster.
+        Vote sheet names that were fuzzy matched or couldn't be resolved are reported to `names_report_path`, unless it's None
+
+        With `write_change_feed`, what changed since the last export is also written as a numbered
+        delta, see change_feed.py
+
+        Everything goes in `output_base_path`, output/<session> by default
+
+        Finishes by writing the run report to `run_report_path`, unless it's None
+
+        With `only_keys`, per-bill files and database rows are only written for those bills, e.g. the
+        ones a refresh rebuilt. Combined files, the vote matrix and the database's bill set still cover every bill
+
+        Bills with any changed file end up in self.changed_bills. Each bill is done with once
+        it's written, so with streaming on, bills are built and released as this goes
+        """
+        with STATS.stage('export'):
+            # Combined writers remove their temp files if anything below raises
+            with ExitStack() as combined_stack:
+                combined = {}
+                for name in ['all-bills', 'all-bill-actions', 'all-votes']:
+                    combined[name] = [
+                        combined_stack.enter_context(JsonArrayWriter(
+                            join(output_base_path, name + FORMAT_EXTENSIONS[format]), format, gzip))
+                        for format in formats
+                    ]
+
+                def write_combined(name, items):
+                    for writer in combined[name]:
+                        writer.extend(items)
+
+                database = OutputStore(join(output_base_path, OUTPUT_DATABASE_FILENAME)) if write_database else None
+                vote_matrix = VoteMatrixWriter(
+                    join(output_base_path, VOTE_MATRIX_FILENAME),
+                    join(output_base_path, LAWMAKERS_FILENAME),
+                    names_report_path) if write_vote_matrix else None
+                change_feed = ChangeFeedWriter(
+                    join(output_base_path, CHANGE_FEED_DIRNAME), SESSION_ID) if write_change_feed else None
+
+                self.changed_bills = []
+                exported_keys = []
+                for bill in self.bills:
+                    exported_keys.append(bill.key)
+                    write_bill = only_keys is None or bill.key in only_keys
+
+                    bill_data = bill.export()
+                    data_changed = write_bill and write_json(bill_data, join(
+                        output_base_path, f'{bill.urlKey}--data.json'), log=False)
+                    write_combined('all-bills', [bill_data])
+
+                    actions = bill.export_actions()
+                    actions_changed = write_bill and write_json(actions, join(
+                        output_base_path, f'{bill.urlKey}--actions.json'), log=False)
+                    write_combined('all-bill-actions', actions)
+
+                    votes = bill.export_votes()
+                    votes_changed = write_bill and write_json(votes, join(
+                        output_base_path, f'{bill.urlKey}--votes.json'), log=False)
+                    write_combined('all-votes', votes)
+                    if vote_matrix:
+                        vote_matrix.extend(votes)
+
+                    if database and write_bill:
+                        database.update_bill(bill_data, actions, votes)
+
+                    if change_feed:
+                        change_feed.add(bill_data, actions, votes, unchanged=not write_bill)
+
+                    if data_changed or actions_changed or votes_changed:
+                        self.changed_bills.append(bill.key)
+
+                print(f'{len(self.changed_bills)} of {len(exported_keys)} bills changed')
+
+                # Finish combined files, now nothing's left to clean up
+                combined_stack.pop_all()
+                for writers in combined.values():
+                    for writer in writers:
+                        changed = writer.close()
+                        print('Written to' if changed else 'Unchanged', writer.path)
+
+            if vote_matrix:
+                vote_matrix.close()
+
+            if change_feed:
+                change_feed.close()
+
+            if database:
+                database.remove_bills_except(exported_keys)
+                database.close()
+        STATS.count('export.changedBills', len(self.changed_bills))
+
+        if run_report_path:
+            STATS.save(run_report_path, session=SESSION_ID,
+                       options=self.options)
@@ -1,5 +1,102 @@
+import re
+
+from name_resolution import NameResolver, strip_proxy
+
+# Floor vote sequence numbers start with the chamber, e.g. H26, S112
+CHAMBERS = {'H': 'house', 'S': 'senate'}
+# Committee vote sheets are filed by chamber, e.g. .../minutes/house/votesheets/HB0001APH230106.pdf
+COMMITTEE_CHAMBER = re.compile(r'/minutes/(house|senate)/')
+
+
+def vote_chamber(vote):
+    if vote['type'] == 'floor' and vote.get('seq_number'):
+        return CHAMBERS.get(vote['seq_number'][0])
+    match = COMMITTEE_CHAMBER.search(vote.get('url') or '')
+    return match.group(1) if match else None
+
+
 class Lawmaker:
-    """Data structure for Montana Legislator"""
+    """Data structure for Montana Legislator
+
+    - id - integer ID, also the lawmaker's column in the vote matrix (see vote_matrix.py)
+    - name - name as it appears on floor votes, e.g. 'Bishop, Laurie'
+    - chamber - 'house' or 'senate', from the floor votes they're recorded on, None if only on committee votes
+    - vote_count - number of votes they're recorded on
+    - aliases - other spellings of their name on vote sheets, e.g. 'Bishop, Laurie;byproxy'
+    """
+
+    __slots__ = ('id', 'name', 'chamber', 'vote_count', 'aliases')
+
+    def __init__(self, id, name, chamber=None, vote_count=0):
+        self.id = id
+        self.name = name
+        self.chamber = chamber
+        self.vote_count = vote_count
+        self.aliases = set()
+
+    def export(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'chamber': self.chamber,
+            'voteCount': self.vote_count,
+            'aliases': sorted(self.aliases),
+        }
+
+
+class LawmakerRoster:
+    """
+    Every lawmaker recorded on a session's votes, with integer IDs
+
+    Names are collected as votes go by, each distinct spelling (per chamber) getting an index.
+    `finalize` then resolves them all at once against the floor vote names, see
+    name_resolution.py, since committee votes can come before the floor votes that spell their
+    members' names properly. Lawmakers are numbered in name order, so IDs only depend on who's
+    in the session, not the order bills were scraped in. Names that don't resolve become
+    lawmakers of their own, minus any proxy suffix, and are listed in the resolver's report.
+    """
 
     def __init__(self):
-        pass
+        self.spellings = {}  # (name as printed, chamber) -> index
+        self.occurrences = []
+        self.floor_names = {}  # name -> chamber
+        self.lawmakers = []
+        self.ids = []  # lawmaker ID by spelling index
+        self.resolver = None
+
+    def add(self, raw_name, vote):
+        """
+        Returns the index of a name as printed on a vote, mapped to a lawmaker ID by `finalize`
+        """
+        chamber = vote_chamber(vote)
+        if vote['type'] == 'floor':
+            self.floor_names.setdefault(raw_name, chamber)
+        index = self.spellings.get((raw_name, chamber))
+        if index is None:
+            index = self.spellings[(raw_name, chamber)] = len(self.occurrences)
+            self.occurrences.append(0)
+        self.occurrences[index] += 1
+        return index
+
+    def finalize(self):
+        self.resolver = NameResolver(self.floor_names)
+        by_name = {}
+        resolved = []
+        for (raw_name, chamber), index in self.spellings.items():
+            name = self.resolver.resolve(raw_name, chamber, self.occurrences[index]) or strip_proxy(raw_name)
+            lawmaker = by_name.get(name)
+            if lawmaker is None:
+                lawmaker = by_name[name] = Lawmaker(None, name, self.floor_names.get(name))
+            lawmaker.vote_count += self.occurrences[index]
+            if raw_name != name:
+                lawmaker.aliases.add(raw_name)
+            resolved.append(lawmaker)
+
+        self.lawmakers = sorted(by_name.values(), key=lambda lawmaker: lawmaker.name)
+        for i, lawmaker in enumerate(self.lawmakers):
+            lawmaker.id = i
+        self.ids = [lawmaker.id for lawmaker in resolved]
+        return self.lawmakers
+
+    def export(self):
+        return [lawmaker.export() for lawmaker in self.lawmakers]
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+from os.path import exists
+from threading import Lock
+
+from functions import write_json, read_json
+
+from config import MISSING_VOTE_RETRY_HOURS, MISSING_VOTE_MAX_RETRY_HOURS
+
+
+class MissingVoteIndex:
+    """
+    Persisted negative cache of vote page URLs that failed to fetch, keyed by URL
+
+    Each entry holds the vote error to report, the underlying reason (e.g. "No Vote Records Found",
+    HTTP 404), how many attempts have failed and when the URL is next worth trying. The wait
+    doubles with each failed attempt, from MISSING_VOTE_RETRY_HOURS up to MISSING_VOTE_MAX_RETRY_HOURS,
+    so dead links stop costing a request every run but a vote posted late is still picked up.
+
+    - now - retry scheduling time, defaults to current time
+    - offline - nothing is ever due for a retry, for rebuilds from cache that don't fetch
+
+    """
+
+    def __init__(self, path, now=None, offline=False):
+        self.path = path
+        self.set_time(now)
+        self.offline = offline
+        self.entries = read_json(path) if exists(path) else {}
+        self.lock = Lock()
+        self.changed = False
+
+    def set_time(self, now=None):
+        # Moves retry scheduling time along, for an index kept between scrapes by watch mode
+        self.now = now or datetime.now()
+
+    def get(self, url):
+        return self.entries.get(url)
+
+    def should_retry(self, url):
+        """
+        Whether a URL is unknown or its next retry is due, never when offline
+        """
+        if self.offline:
+            return False
+        entry = self.entries.get(url)
+        return entry is None or datetime.fromisoformat(entry['nextRetry']) <= self.now
+
+    def record_failure(self, url, error, reason):
+        with self.lock:
+            previous = self.entries.get(url, {})
+            attempts = previous.get('attempts', 0) + 1
+            wait = min(MISSING_VOTE_RETRY_HOURS * 2 ** (attempts - 1),
+                       MISSING_VOTE_MAX_RETRY_HOURS)
+            self.entries[url] = {
+                'error': error,
+                'reason': reason,
+                'attempts': attempts,
+                'firstFailed': previous.get('firstFailed', self.now.isoformat(timespec='seconds')),
+                'lastAttempt': self.now.isoformat(timespec='seconds'),
+                'nextRetry': (self.now + timedelta(hours=wait)).isoformat(timespec='seconds'),
+            }
+            self.changed = True
+
+    def record_success(self, url):
+        with self.lock:
+            if self.entries.pop(url, None) is not None:
+                self.changed = True
+
+    def save(self, path=None):
+        # Written back where it was read from unless given a `path`, e.g. a shard's fragment
+        if self.changed:
+            write_json({url: self.entries[url] for url in sorted(self.entries)}, path or self.path)
@@ -0,0 +1,141 @@
+import hashlib
+import json
+import re
+from datetime import datetime, timedelta
+from os.path import exists
+
+from functions import write_json, read_json
+
+from config import SAME_DAY_REFETCH_HOURS, DEADLINE_PRIORITY_DAYS
+
+DATE_FORMAT = '%m/%d/%Y'
+
+# Refresh priority points, see RefreshManifest.priority
+STATUS_TODAY_PRIORITY = 4
+NEW_FLOOR_VOTE_PRIORITY = 2
+NEAR_DEADLINE_PRIORITY = 1
+
+# Bill list last actions that come with a floor vote, e.g. '(H) 3rd Reading Passed'. Committee
+# votes are 'Committee Executive Action--...' and 'Tabled in Committee'
+FLOOR_VOTE_ACTION = re.compile(
+    r'\b(2nd|3rd) Reading\b|Veto Override|Conference Committee Report|'
+    r'^(\([HS]\) )?(Resolution Adopted|Motion Carried|Motion Failed)')
+
+
+def fingerprint_row(raw):
+    # Stable hash of a bill list row, insensitive to key order
+    return hashlib.sha1(json.dumps(raw, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class RefreshManifest:
+    """
+    Persisted record of bill list rows and bill page fetches, keyed by bill key
+
+    Each entry holds a fingerprint of the bill's bill list row as of its last page fetch,
+    plus when that fetch happened. Planning is a dict lookup per row, so O(n) in session size.
+
+    Refresh logic: Fetch bill page if
+        - refresh is forced
+        - bill is new
+        - bill list row has changed since the last fetch
+        - bill status date is today and the page hasn't been fetched in SAME_DAY_REFETCH_HOURS
+
+    Each plan also carries a refresh priority, for scrapes that might not get to every bill
+
+    - last_scrape_bills - previous bill data, used to seed bills missing from the manifest and for priorities
+    - now - planning time, defaults to current time
+
+    """
+
+    def __init__(self, path, last_scrape_bills=None, force_refresh=False, now=None):
+        self.path = path
+        self.force_refresh = force_refresh
+        self.set_time(now)
+
+        self.entries = read_json(path) if exists(path) else {}
+        self.last_scrape_bills = {bill['key']: bill for bill in last_scrape_bills or []}
+
+    def set_time(self, now=None):
+        """
+        Moves planning time along, for a manifest kept between scrapes by watch mode
+        """
+        self.now = now or datetime.now()
+        self.today = self.now.strftime(DATE_FORMAT)
+
+    def plan(self, bill_list):
+        """
+        Returns refresh decisions for bill list rows, in bill list order
+        """
+        return [self.plan_bill(raw) for raw in bill_list]
+
+    def plan_bill(self, raw):
+        key = raw['key']
+        entry = self.entries.get(key)
+        last = self.last_scrape_bills.get(key)
+        fetched = datetime.fromisoformat(
+            entry['fetched']) if entry and entry.get('fetched') else None
+
+        if self.force_refresh:
+            reason = 'forced'
+        elif entry is None and last is None:
+            reason = 'new bill'
+        elif entry is not None and entry['fingerprint'] != fingerprint_row(raw):
+            reason = 'bill list row changed'
+        elif entry is None and (raw['statusDate'] != last['statusDate']
+                                or raw['lastAction'] != last['lastAction']):
+            # Bill predates the manifest, fall back to comparing with last scrape
+            reason = 'status changed since last scrape'
+        elif raw['statusDate'] == self.today \
+                and (fetched is None or self.now - fetched >= timedelta(hours=SAME_DAY_REFETCH_HOURS)):
+            reason = 'status date is today'
+        else:
+            reason = None
+
+        return {
+            'key': key,
+            'needsRefresh': reason is not None,
+            'reason': reason or 'unchanged',
+            'lastFetched': entry.get('fetched') if entry else None,
+            'priority': self.priority(raw, last),
+        }
+
+    def priority(self, raw, last=None):
+        """
+        Points for how soon a bill should be refreshed, higher first, from
+        - status date is today (STATUS_TODAY_PRIORITY)
+        - last action is a floor vote it wasn't at the last scrape (NEW_FLOOR_VOTE_PRIORITY)
+        - transmittal or amended return deadline, as of the last scrape, is
+          DEADLINE_PRIORITY_DAYS or fewer days away (NEAR_DEADLINE_PRIORITY)
+        """
+        priority = 0
+        if raw['statusDate'] == self.today:
+            priority += STATUS_TODAY_PRIORITY
+        if FLOOR_VOTE_ACTION.search(raw['lastAction']) \
+                and (last is None or last['lastAction'] != raw['lastAction']):
+            priority += NEW_FLOOR_VOTE_PRIORITY
+        if last is not None:
+            for deadline in [last.get('transmittalDeadline'), last.get('amendedReturnDeadline')]:
+                try:
+                    days = (datetime.strptime(deadline, DATE_FORMAT).date() - self.now.date()).days
+                except (TypeError, ValueError):
+                    continue
+                if 0 <= days <= DEADLINE_PRIORITY_DAYS:
+                    priority += NEAR_DEADLINE_PRIORITY
+                    break
+        return priority
+
+    def record(self, raw, fetched):
+        """
+        Updates a bill's entry after it's built. Only bills whose page was fetched get a new fetch time
+        """
+        previous = self.entries.get(raw['key'], {})
+        self.entries[raw['key']] = {
+            'fingerprint': fingerprint_row(raw),
+            'fetched': self.now.isoformat(timespec='seconds') if fetched else previous.get('fetched'),
+        }
+
+    def save(self, path=None):
+        """
+        Writes the manifest back where it was read from, or to `path`, e.g. a shard's fragment
+        """
+        write_json({key: self.entries[key] for key in sorted(self.entries)}, path or self.path)
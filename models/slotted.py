@@ -0,0 +1,29 @@
+from fetch import SERIAL_SCHEDULER
+
+# Attributes holding threads, connections or locks, which can't go to or come back from rebuild
+# worker processes. Unpickled objects get these defaults instead
+PROCESS_LOCAL_DEFAULTS = {
+    'scheduler': SERIAL_SCHEDULER,
+    'parse_cache': None,
+    'missing_votes': None,
+}
+
+
+class PicklableSlots:
+    """
+    Pickling for the __slots__ model classes (Bill, BillAction, Vote), see PROCESS_LOCAL_DEFAULTS
+
+    Slots never set, e.g. actions on a Bill built with fetch_actions=False, are left unset
+    """
+
+    __slots__ = ()
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__
+                if name not in PROCESS_LOCAL_DEFAULTS and hasattr(self, name)}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+        for name, value in PROCESS_LOCAL_DEFAULTS.items():
+            setattr(self, name, value)
@@ -1,29 +1,99 @@
+import hashlib
 import json
-import requests
+import logging
 from bs4 import BeautifulSoup
 import re
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from functools import partial
+from io import BytesIO
 from PyPDF2 import PdfReader
-from os.path import exists, join
+from os.path import join
 
-from config import SESSION_ID, CACHE_BASE_PATH
+from config import SESSION_ID, CACHE_BASE_PATH, PARSER_BACKEND
+
+from fetch import SERIAL_SCHEDULER
+from models.slotted import PicklableSlots
+from cache_store import get_cache_store
+from instrumentation import STATS
+
+import lxml_parsing as lx
 
 FLOOR_DATE_FORMAT = '%B %m, %Y'
 
+# Bump when parser output changes, to invalidate that parser's parse cache entries
+FLOOR_VOTE_PARSER_VERSION = 1
+COMMITTEE_VOTE_PARSER_VERSION = 1
+
+# Extracted committee vote sheet text is cached next to each PDF, e.g. votes/HB1-0016.pdf.txt,
+# with the PDF's hash on the first line so a re-downloaded PDF gets re-extracted
+TEXT_SIDECAR_HEADER = '# sha256 '
+
+log = logging.getLogger(__name__)
+
+
+def extract_pdf_text(raw):
+    with STATS.timer('parse.pdfText'):
+        return PdfReader(BytesIO(raw)).getPage(0).extractText()
+
+
+def read_committee_vote_text(pdf_key, raw=None, cache_base_path=CACHE_BASE_PATH):
+    """
+    Returns page text for a committee vote sheet PDF, e.g. votes/HB1-0016.pdf, decoding the PDF
+    only if its text sidecar is missing or was extracted from different PDF bytes
+    """
+    store = get_cache_store(cache_base_path)
+    if raw is None:
+        raw = store.read(pdf_key)
+    pdf_hash = hashlib.sha256(raw).hexdigest()
+    sidecar_key = pdf_key + '.txt'
+
+    sidecar = store.read(sidecar_key)
+    if sidecar is not None:
+        header, _, text = sidecar.decode('utf-8').partition('\n')
+        if header == TEXT_SIDECAR_HEADER + pdf_hash:
+            STATS.count('pdfText.sidecarHits')
+            return text
+
+    text = extract_pdf_text(raw)
+    store.write(sidecar_key, (TEXT_SIDECAR_HEADER + pdf_hash + '\n' + text).encode('utf-8'))
+    return text
+
+
+def extract_committee_vote_texts(pdf_keys, processes=None, cache_base_path=CACHE_BASE_PATH):
+    """
+    Fills in missing or stale text sidecars for a batch of committee vote PDFs across a process pool
+    """
+    read_text = partial(read_committee_vote_text, cache_base_path=cache_base_path)
+    with ProcessPoolExecutor(processes) as pool:
+        for _ in pool.map(read_text, pdf_keys, chunksize=16):
+            pass
 
-class Vote:
+
+class Vote(PicklableSlots):
     """Data structure for Montana Legislature vote
 
         Can be a committtee, floor or mail veto override vote.
     """
 
+    __slots__ = ('id', 'inputs', 'cache_base_path', 'scheduler', 'parse_cache', 'parser_backend',
+                 'missing_votes', 'bill_needs_refresh', 'use_cache', 'use_verbose_logging', 'data')
+
     def __init__(self, inputs,
                  bill_needs_refresh=False,
                  use_verbose_logging=False,
-                 cache_base_path=CACHE_BASE_PATH):
+                 cache_base_path=CACHE_BASE_PATH,
+                 scheduler=SERIAL_SCHEDULER,
+                 parse_cache=None,
+                 parser_backend=PARSER_BACKEND,
+                 missing_votes=None):
         self.id = inputs['action_id']
         self.inputs = inputs
         self.cache_base_path = cache_base_path
+        self.scheduler = scheduler
+        self.parse_cache = parse_cache
+        self.parser_backend = parser_backend
+        self.missing_votes = missing_votes
 
         self.bill_needs_refresh = bill_needs_refresh
         self.use_cache = True  # TODO - decide how to make this smarter
@@ -45,51 +115,77 @@ class Vote:
 
         # print(json.dumps(self.data, indent=4))
 
+    @classmethod
+    def from_export(cls, data):
+        """
+        Recreates a vote from its exported data, e.g. from the last scrape's --votes.json, without
+        reading or parsing its source page
+        """
+        vote = cls.__new__(cls)
+        vote.id = data['action_id']
+        vote.inputs = None
+        vote.cache_base_path = CACHE_BASE_PATH
+        vote.scheduler = SERIAL_SCHEDULER
+        vote.parse_cache = None
+        vote.parser_backend = PARSER_BACKEND
+        vote.missing_votes = None
+        vote.bill_needs_refresh = False
+        vote.use_cache = True
+        vote.use_verbose_logging = False
+        vote.data = data
+        return vote
+
     def parse_floor_vote(self, url):
         """
         Parse HTML floor vote page,
         e.g. http://laws.leg.mt.gov/legprd/LAW0211W$BLAC.VoteTabulation?P_VOTE_SEQ=H2050&P_SESS=20211
         """
-        CACHE_PATH = join(self.cache_base_path, 'votes', f'{self.id}.html')
-
-        if exists(CACHE_PATH) and self.use_cache:
-            if self.use_verbose_logging:
-                print('--- Reading floor vote data from', CACHE_PATH)
-            with open(CACHE_PATH, 'r') as f:
-                text = f.read()
-        elif not exists(CACHE_PATH) and not self.bill_needs_refresh:
+        store = get_cache_store(self.cache_base_path)
+        CACHE_PATH = join('votes', f'{self.id}.html')
+
+        if store.exists(CACHE_PATH) and self.use_cache:
+            log.debug('--- Reading floor vote data from %s', CACHE_PATH)
+            STATS.count('floorVote.cacheReads')
+            text = store.read_text(CACHE_PATH)
+        elif not store.exists(CACHE_PATH) and not self.bill_needs_refresh and self.missing_votes is None:
             # Skips effort to fetch uncached bills from URL, saving time for broken vote links
             # that weren't fetched successfully last time
             # Should trigger only for bills that don't need an update
-            print(f'ooo Skipping missing floor data for {self.id} from', url)
+            # With a missing vote index, its retry schedule decides this instead
+            log.debug('ooo Skipping missing floor data for %s from %s', self.id, url)
+            STATS.count('floorVote.skippedMissing')
             self.data['totals'] = self.inputs['bill_page_vote_count']
             self.data['error'] = 'Skipped previously missing vote page'
             return None
         elif not url:
             self.data['totals'] = self.inputs['bill_page_vote_count']
             self.data['error'] = 'Missing vote page'
+            STATS.count('floorVote.missingUrl')
+            return None
+        elif self.skip_known_missing(url, 'floorVote'):
             return None
         else:
-            if self.use_verbose_logging:
-                print(f'+++ Fetching floor vote data for {self.id} from', url)
-            response = requests.get(url)
+            log.debug('+++ Fetching floor vote data for %s from %s', self.id, url)
+            STATS.count('floorVote.fetches')
+            response = self.scheduler.get(
+                url, cache_path=CACHE_PATH, store=store)
             text = response.text
             if "No Vote Records Found for this Action." in text:
                 # Missing vote page error. Label as error and move on
                 self.data['totals'] = self.inputs['bill_page_vote_count']
                 self.data['error'] = 'Missing vote page'
-                err = self.data['error']
-                if self.use_verbose_logging:
-                    print(f'  * {err} fetching {self.id}. URL:', url)
+                log.debug('  * %s fetching %s. URL: %s', self.data['error'], self.id, url)
+                STATS.count('floorVote.missingPage')
+                if self.missing_votes is not None:
+                    self.missing_votes.record_failure(
+                        url, self.data['error'], 'No Vote Records Found')
                 return None
+            if self.missing_votes is not None:
+                self.missing_votes.record_success(url)
 
             # Write cache
-            if self.use_verbose_logging:
-                print('--- Writing floor vote data to cache', CACHE_PATH)
-            with open(CACHE_PATH, 'w') as f:
-                f.write(text)
-
-        soup = BeautifulSoup(text, 'lxml')
+            log.debug('--- Writing floor vote data to cache %s', CACHE_PATH)
+            self.scheduler.store(response, CACHE_PATH, store=store)
 
         if not url:
             # For cases when we're scraping a cached page where the link has disappeared
@@ -104,17 +200,30 @@ class Vote:
             self.data['seq_number'] = re.search(
                 r'(?<=VOTE_SEQ\=)(H|S)\d+', url).group(0)
 
+        parse = self.parse_floor_vote_html_lxml if self.parser_backend == 'lxml' else self.parse_floor_vote_html
+        self.data.update(self.parse_with_cache(
+            'floor-vote', FLOOR_VOTE_PARSER_VERSION, text.encode('utf-8'),
+            lambda: self.timed_parse('parse.floorVote', parse, text)))
+
+    @staticmethod
+    def parse_floor_vote_html(text):
+        """
+        Returns date, description, totals and votes by name from floor vote page HTML
+        """
+        soup = BeautifulSoup(text, 'lxml')
+        data = {}
+
         vote_date = soup.find(text=re.compile(
             "DATE:")).text.replace(r'DATE:', '').strip()
-        self.data['date'] = vote_date
+        data['date'] = vote_date
 
         vote_description = soup.find_all('p')[1].text.strip()
-        self.data['description'] = vote_description
+        data['description'] = vote_description
 
         total_table = soup.find(text="YEAS").find_parent('table')
         total_cells = total_table.find_all('tr')[1].find_all('td')
 
-        self.data['totals'] = {
+        data['totals'] = {
             'Y': int(total_cells[0].text),
             'N': int(total_cells[1].text),
             'E': int(total_cells[2].text),
@@ -131,80 +240,166 @@ class Vote:
                 'name': re.search(r'(?<=^(Y|N|E|A)).+', text).group(0).strip(),
                 'vote': re.search(r'^(Y|N|E|A)', text).group(0),
             })
-        self.data['votes'] = votes_by_name
+        data['votes'] = votes_by_name
+        return data
+
+    @staticmethod
+    def parse_floor_vote_html_lxml(text):
+        """
+        lxml backend equivalent of parse_floor_vote_html
+        """
+        root = lx.parse_html(text)
+        data = {}
+
+        data['date'] = lx.find_text_containing(
+            root, "DATE:").replace(r'DATE:', '').strip()
+        data['description'] = lx.text(lx.find_all(root, 'p')[1]).strip()
+
+        total_table = lx.find_string_parent(lx.find_text(root, "YEAS"), 'table')
+        total_cells = lx.find_all(lx.find_all(total_table, 'tr')[1], 'td')
+
+        data['totals'] = {
+            'Y': int(lx.text(total_cells[0])),
+            'N': int(lx.text(total_cells[1])),
+            'E': int(lx.text(total_cells[2])),
+            'A': int(lx.text(total_cells[3])),
+        }
+
+        votes_by_name = []
+        for td in lx.find_all(lx.find_all(root, 'table')[2], 'td'):
+            text = lx.text(td)
+            if len(text.strip()) == 0:
+                continue
+            votes_by_name.append({
+                'name': re.search(r'(?<=^(Y|N|E|A)).+', text).group(0).strip(),
+                'vote': re.search(r'^(Y|N|E|A)', text).group(0),
+            })
+        data['votes'] = votes_by_name
+        return data
 
     def parse_committee_vote(self, url):
         """
         Parse PDF committee vote page,
         e.g. https://leg.mt.gov/bills/2021/minutes/house/votesheets/HB0701TAH210401.pdf
         """
-        CACHE_PATH = join(self.cache_base_path, 'votes', f'{self.id}.pdf')
+        store = get_cache_store(self.cache_base_path)
+        CACHE_PATH = join('votes', f'{self.id}.pdf')
 
         self.data['seq_number'] = None  # Only for floor votes
         self.data['error'] = None
 
-        if exists(CACHE_PATH) and self.use_cache:
-            if self.use_verbose_logging:
-                print('--- Reading committee vote data from', CACHE_PATH)
+        if store.exists(CACHE_PATH) and self.use_cache:
+            log.debug('--- Reading committee vote data from %s', CACHE_PATH)
+            STATS.count('committeeVote.cacheReads')
             # Read existing PDF below for either method
-        elif not exists(CACHE_PATH) and not self.bill_needs_refresh:
+        elif not store.exists(CACHE_PATH) and not self.bill_needs_refresh and self.missing_votes is None:
             # Skips effort to fetch uncached bills from URL, saving time for broken vote links
             # Should trigger only for bills that don't need an update
-            print(f'ooo Skipping missing committee vote data for {self.id}')
+            log.debug('ooo Skipping missing committee vote data for %s', self.id)
+            STATS.count('committeeVote.skippedMissing')
             self.data['totals'] = self.inputs['bill_page_vote_count']
             self.data['error'] = 'Skipped previously missing vote page'
             return None
+        elif url is not None and self.skip_known_missing(url, 'committeeVote'):
+            return None
         elif url is not None:
-            if self.use_verbose_logging:
-                print('+++ Fetching committee vote data from URL', url)
-            response = requests.get(url)
+            log.debug('+++ Fetching committee vote data from URL %s', url)
+            STATS.count('committeeVote.fetches')
+            response = self.scheduler.get(
+                url, cache_path=CACHE_PATH, binary=True, store=store)
             if response.status_code == 200:
-                raw = response.content
-                with open(CACHE_PATH, 'wb') as f:
-                    f.write(raw)
+                self.scheduler.store(
+                    response, CACHE_PATH, binary=True, store=store)
+                if self.missing_votes is not None:
+                    self.missing_votes.record_success(url)
             else:
                 self.data['totals'] = self.inputs['bill_page_vote_count']
                 self.data['error'] = 'Missing PDF'
+                STATS.count('committeeVote.missingPdf')
+                if self.missing_votes is not None:
+                    self.missing_votes.record_failure(
+                        url, self.data['error'], f'HTTP {response.status_code}')
         else:
             self.data['totals'] = self.inputs['bill_page_vote_count']
             self.data['error'] = 'Missing URL'
+            STATS.count('committeeVote.missingUrl')
 
         if self.data['error'] is not None:
             # Terminate data parsing here and move on
-            err = self.data['error']
-            if self.use_verbose_logging:
-                print(f'  * {err} fetching {self.id}. URL:', url)
+            log.debug('  * %s fetching %s. URL: %s', self.data['error'], self.id, url)
             return None
 
-        with open(CACHE_PATH, 'rb') as f:
-            pdf = PdfReader(f)
-            text = pdf.getPage(0).extractText()
-
-            header_rows = re.search(
-                r'(?s).+(?=\nYEAS\s+(\-|–)\s+[0-9]+\s+NAYS\s+(\-|–)\s+[0-9]+)', text).group(0).split('\n')
-            total_row = re.search(
-                r'YEAS\s+(\-|–)\s+[0-9]+\s+NAYS\s+(\-|–)\s+[0-9]+', text).group(0)
-            vote_re = re.compile(r'(Y|N|E|A).+')
-            vote_rows = list(
-                filter(vote_re.match, text.split('\n')[(len(header_rows)+1):]))
-
-            # Assuming header rows are consistent
-            self.data['date'] = header_rows[1]
-            self.data['description'] = header_rows[-1]
-
-            self.data['totals'] = {
-                'Y': int(re.search(r'(?<=YEAS (\-|–) )\d+', total_row.replace('  ', ' ')).group(0)),
-                'N': int(re.search(r'(?<=NAYS (\-|–) )\d+', total_row.replace('  ', ' ')).group(0)),
-            }
-
-            votes_by_name = []
-            for row in vote_rows:
-                votes_by_name.append({
-                    'name': re.search(r'(?<=^(Y|N|E|A)).+', row).group(0).strip()
-                    .replace(' ', '').replace(',', ', ').replace(';byProxy', ''),
-                    'vote': re.search(r'^(Y|N|E|A)', row).group(0),
-                })
-            self.data['votes'] = votes_by_name
+        raw = store.read(CACHE_PATH)
+        self.data.update(self.parse_with_cache(
+            'committee-vote', COMMITTEE_VOTE_PARSER_VERSION, raw,
+            lambda: self.timed_parse('parse.committeeVote', self.parse_committee_vote_text,
+                                     read_committee_vote_text(CACHE_PATH, raw, self.cache_base_path))))
+
+    @staticmethod
+    def parse_committee_vote_text(text):
+        """
+        Returns date, description, totals and votes by name from committee vote sheet PDF text
+        """
+        data = {}
+
+        header_rows = re.search(
+            r'(?s).+(?=\nYEAS\s+(\-|–)\s+[0-9]+\s+NAYS\s+(\-|–)\s+[0-9]+)', text).group(0).split('\n')
+        total_row = re.search(
+            r'YEAS\s+(\-|–)\s+[0-9]+\s+NAYS\s+(\-|–)\s+[0-9]+', text).group(0)
+        vote_re = re.compile(r'(Y|N|E|A).+')
+        vote_rows = list(
+            filter(vote_re.match, text.split('\n')[(len(header_rows)+1):]))
+
+        # Assuming header rows are consistent
+        data['date'] = header_rows[1]
+        data['description'] = header_rows[-1]
+
+        data['totals'] = {
+            'Y': int(re.search(r'(?<=YEAS (\-|–) )\d+', total_row.replace('  ', ' ')).group(0)),
+            'N': int(re.search(r'(?<=NAYS (\-|–) )\d+', total_row.replace('  ', ' ')).group(0)),
+        }
+
+        votes_by_name = []
+        for row in vote_rows:
+            votes_by_name.append({
+                'name': re.search(r'(?<=^(Y|N|E|A)).+', row).group(0).strip()
+                .replace(' ', '').replace(',', ', ').replace(';byProxy', ''),
+                'vote': re.search(r'^(Y|N|E|A)', row).group(0),
+            })
+        data['votes'] = votes_by_name
+        return data
+
+    @staticmethod
+    def timed_parse(timer, parse, source):
+        with STATS.timer(timer):
+            return parse(source)
+
+    def parse_with_cache(self, parser, version, source, parse):
+        if self.parse_cache:
+            return self.parse_cache.get_or_parse(parser, version, source, parse)
+        return parse()
+
+    def skip_known_missing(self, url, kind):
+        """
+        Labels the vote with its recorded error, without a request, if the missing vote index
+        says its page isn't due for another try. Returns whether it did
+
+        An offline index never fetches, so pages it doesn't know are skipped as before it existed
+        """
+        if self.missing_votes is None or self.missing_votes.should_retry(url):
+            return False
+        entry = self.missing_votes.get(url)
+        self.data['totals'] = self.inputs['bill_page_vote_count']
+        if entry is None:
+            log.debug('ooo Skipping missing %s for %s from %s', kind, self.id, url)
+            STATS.count(f'{kind}.skippedMissing')
+            self.data['error'] = 'Skipped previously missing vote page'
+            return True
+        log.debug('ooo Skipping known missing %s for %s until %s (%s, %s attempts)',
+                  kind, self.id, entry['nextRetry'], entry['reason'], entry['attempts'])
+        STATS.count(f'{kind}.knownMissing')
+        self.data['error'] = entry['error']
+        return True
 
     def parse_override_vote(self):
         self.data['seq_number'] = None  # Only for floor votes
@@ -0,0 +1,170 @@
+"""
+Resolves lawmaker names as printed on vote sheets to one spelling per lawmaker
+
+Floor votes list each chamber's members the same way every time, e.g. 'Running Wolf, Tyson',
+so those names make up the roster. Committee vote sheets spell names their own way:
+'RunningWolf, Tyson' (spaces dropped by parse_committee_vote), 'Abbott, Kim;byproxy',
+'Flament, Douglas' for 'Flament, Doug', or 'bbott, Kim' with a letter lost in PDF extraction.
+
+NameResolver tries, in order: explicit overrides, exact roster names, normalized keys,
+first name matches within a surname, then a trigram index for near misses. Every lookup is
+memoized, so per-occurrence cost is a dict lookup, and anything that doesn't resolve is kept
+for a bulk report instead of failing.
+"""
+import re
+from collections import Counter
+
+from config import LAWMAKER_NAME_OVERRIDES
+
+PROXY_SUFFIX = re.compile(r';\s*by\s*proxy$', re.IGNORECASE)
+NICKNAME = re.compile(r'\(([^)]*)\)')
+NON_LETTERS = re.compile(r'[^a-z]')
+
+# Trigram similarity (Dice coefficient) a near miss needs, and how far ahead of the runner-up
+FUZZY_THRESHOLD = 0.6
+FUZZY_MARGIN = 0.15
+
+
+def strip_proxy(raw):
+    return PROXY_SUFFIX.sub('', raw).strip()
+
+
+def split_name(raw):
+    """
+    Returns normalized (surname, first names) keys for a 'Last, First' name, with any
+    parenthesized nickname as an extra first name, e.g. 'Tempel, Russel (Russ)' -> ('tempel', ['russel', 'russ'])
+    """
+    name = strip_proxy(raw)
+    last, _, first = name.partition(',')
+    nicknames = NICKNAME.findall(first)
+    firsts = [NON_LETTERS.sub('', part.lower()) for part in [NICKNAME.sub('', first)] + nicknames]
+    return NON_LETTERS.sub('', last.lower()), [first for first in firsts if first]
+
+
+def normalize_name(raw):
+    """
+    Key that's the same for spellings differing only in case, spacing, punctuation or a proxy
+    suffix, e.g. 'Stewart Peregoy, Sharon' and 'StewartPeregoy, Sharon;byproxy' -> 'stewartperegoy|sharon'
+    """
+    last, firsts = split_name(raw)
+    return f"{last}|{firsts[0] if firsts else ''}"
+
+
+def trigrams(key):
+    padded = f'  {key} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NameResolver:
+    """
+    Precomputed index over a session roster for resolving vote sheet names
+
+    - roster - {name: chamber} of canonical names, chamber 'house', 'senate' or None
+    - overrides - {raw name: canonical name} applied before anything else
+
+    `resolve(raw, chamber)` returns the canonical name or None. A chamber (e.g. a committee
+    vote's) narrows candidates to that chamber's members where it can. Matches that took more
+    than normalizing are kept in `inexact` for review, names that didn't match in `unresolved`.
+    """
+
+    def __init__(self, roster, overrides=LAWMAKER_NAME_OVERRIDES):
+        self.roster = dict(roster)
+        self.overrides = overrides
+        self.memo = {}
+        self.inexact = {}
+        self.unresolved = Counter()
+
+        self.by_key = {}
+        self.by_surname = {}
+        self.by_trigram = {}
+        self.trigrams = {}
+        for name in sorted(self.roster):
+            key = normalize_name(name)
+            self.by_key.setdefault(key, []).append(name)
+            self.by_surname.setdefault(split_name(name)[0], []).append(name)
+            self.trigrams[name] = trigrams(key)
+            for gram in self.trigrams[name]:
+                self.by_trigram.setdefault(gram, []).append(name)
+
+    def resolve(self, raw, chamber=None, occurrences=1):
+        """
+        Returns the canonical name for a name as printed, or None. `occurrences` is how many
+        times it's being resolved at once, for the unresolved report
+        """
+        memo_key = (raw, chamber)
+        if memo_key not in self.memo:
+            self.memo[memo_key] = self.lookup(raw, chamber)
+        resolved, method = self.memo[memo_key]
+        if resolved is None:
+            self.unresolved[memo_key] += occurrences
+        return resolved
+
+    def lookup(self, raw, chamber):
+        """
+        Returns (canonical name or None, how it was matched)
+        """
+        if raw in self.overrides:
+            return self.overrides[raw], 'override'
+        if raw in self.roster:
+            return raw, 'exact'
+
+        matches = self.in_chamber(self.by_key.get(normalize_name(raw), []), chamber)
+        if len(matches) == 1:
+            return matches[0], 'normalized'
+
+        for method, match in [('first name', self.match_first_name(raw, chamber)),
+                              ('trigram', self.match_trigrams(raw, chamber))]:
+            if match is not None:
+                self.inexact[raw] = {'name': match, 'chamber': chamber, 'method': method}
+                return match, method
+        return None, None
+
+    def in_chamber(self, names, chamber):
+        # Narrows to the chamber's members, unless that leaves nothing
+        narrowed = [name for name in names if self.roster[name] == chamber]
+        return narrowed if chamber and narrowed else names
+
+    def match_first_name(self, raw, chamber):
+        """
+        Same surname, and a first name that's a shortened form of the other ('Doug'/'Douglas'),
+        or the only member with that surname ('Bob'/'Robert')
+        """
+        last, firsts = split_name(raw)
+        candidates = self.in_chamber(self.by_surname.get(last, []), chamber)
+        prefixed = [name for name in candidates
+                    if any(a.startswith(b) or b.startswith(a)
+                           for a in firsts for b in split_name(name)[1])]
+        if len(prefixed) == 1:
+            return prefixed[0]
+        if not prefixed and len(candidates) == 1:
+            return candidates[0]
+        return None
+
+    def match_trigrams(self, raw, chamber):
+        """
+        Most similar roster name by trigrams, if it's similar enough and clearly the best
+        """
+        query = trigrams(normalize_name(raw))
+        shared = Counter()
+        for gram in query:
+            shared.update(self.by_trigram.get(gram, []))
+        scored = sorted(((2 * count / (len(query) + len(self.trigrams[name])), name)
+                         for name, count in shared.items()
+                         if not chamber or self.roster[name] in (chamber, None)), reverse=True)
+        if not scored or scored[0][0] < FUZZY_THRESHOLD:
+            return None
+        if len(scored) > 1 and scored[0][0] - scored[1][0] < FUZZY_MARGIN:
+            return None
+        return scored[0][1]
+
+    def report(self):
+        """
+        Bulk report of inexact matches and unresolved names, most frequent unresolved first
+        """
+        return {
+            'rosterSize': len(self.roster),
+            'distinctNames': len(self.memo),
+            'inexact': [{'raw': raw, **match} for raw, match in sorted(self.inexact.items())],
+            'unresolved': [{'raw': raw, 'chamber': chamber, 'occurrences': count}
+                           for (raw, chamber), count in self.unresolved.most_common()],
+        }
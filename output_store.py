@@ -0,0 +1,249 @@
+import hashlib
+import json
+import sqlite3
+from datetime import datetime
+from threading import Lock
+
+# Action dates come off bill pages as 07/14/2022, vote dates off vote pages as March 15, 2023
+DATE_FORMATS = ['%m/%d/%Y', '%B %d, %Y']
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS bills (
+        key TEXT PRIMARY KEY,
+        session TEXT,
+        title TEXT,
+        sponsor TEXT,
+        sponsor_party TEXT,
+        sponsor_district TEXT,
+        status TEXT,
+        status_date TEXT,
+        last_action TEXT,
+        content_hash TEXT NOT NULL,
+        data TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS bills_sponsor ON bills (sponsor);
+    CREATE INDEX IF NOT EXISTS bills_status ON bills (status);
+
+    CREATE TABLE IF NOT EXISTS actions (
+        id TEXT PRIMARY KEY,
+        bill TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        action TEXT,
+        date TEXT,
+        committee TEXT,
+        has_vote INTEGER NOT NULL,
+        data TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS actions_bill ON actions (bill, position);
+    CREATE INDEX IF NOT EXISTS actions_date ON actions (date);
+    CREATE INDEX IF NOT EXISTS actions_committee_date ON actions (committee, date);
+
+    CREATE TABLE IF NOT EXISTS votes (
+        action_id TEXT PRIMARY KEY,
+        bill TEXT NOT NULL,
+        type TEXT,
+        date TEXT,
+        description TEXT,
+        yeas INTEGER,
+        nays INTEGER,
+        error TEXT,
+        data TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS votes_bill ON votes (bill);
+    CREATE INDEX IF NOT EXISTS votes_date ON votes (date);
+
+    CREATE TABLE IF NOT EXISTS vote_records (
+        action_id TEXT NOT NULL,
+        bill TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        vote TEXT NOT NULL,
+        PRIMARY KEY (action_id, position)
+    );
+    CREATE INDEX IF NOT EXISTS vote_records_name ON vote_records (name);
+    CREATE INDEX IF NOT EXISTS vote_records_bill ON vote_records (bill);
+'''
+
+
+def iso_date(text):
+    """
+    Returns a scraped date as YYYY-MM-DD so it sorts and compares in SQL, None if it doesn't parse
+    """
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text.strip(), date_format).date().isoformat()
+        except (AttributeError, ValueError):
+            continue
+    return None
+
+
+def hash_bill(bill_data, actions, votes):
+    serialized = json.dumps([bill_data, actions, votes], sort_keys=True)
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+
+class OutputStore:
+    """
+    Normalized SQLite copy of scraped output, e.g. output/20231/laws.sqlite
+
+    Tables are bills, actions, votes and vote_records (one row per lawmaker per vote), indexed
+    for lookups by bill, sponsor, status, committee, date and lawmaker name. Each row also keeps
+    its exported JSON in a `data` column, so query results match the JSON output files. Vote
+    `data` has its name-by-name votes emptied out, they live in vote_records.
+
+    Bills are written incrementally with `update_bill`: a bill whose exported data, actions and
+    votes hash the same as last time is skipped, otherwise its rows are replaced in one
+    transaction.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(
+            path, timeout=60, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(SCHEMA)
+        self.connection.commit()
+        self.lock = Lock()
+        self.hashes = dict(self.connection.execute(
+            'SELECT key, content_hash FROM bills').fetchall())
+        self.updated = 0
+
+    def update_bill(self, bill_data, actions, votes):
+        """
+        Replaces a bill's rows if its exported data has changed, returning whether it did
+        """
+        key = bill_data['key']
+        content_hash = hash_bill(bill_data, actions, votes)
+        with self.lock:
+            if self.hashes.get(key) == content_hash:
+                return False
+            with self.connection:
+                self._delete_bill(key)
+                self._insert_bill(bill_data, actions, votes, content_hash)
+            self.hashes[key] = content_hash
+            self.updated += 1
+        return True
+
+    def remove_bills_except(self, keys):
+        """
+        Drops bills that are no longer in the bill list
+        """
+        with self.lock:
+            stale = set(self.hashes) - set(keys)
+            with self.connection:
+                for key in stale:
+                    self._delete_bill(key)
+                    del self.hashes[key]
+        return sorted(stale)
+
+    def _delete_bill(self, key):
+        for table, column in [('bills', 'key'), ('actions', 'bill'), ('votes', 'bill'), ('vote_records', 'bill')]:
+            self.connection.execute(
+                f'DELETE FROM {table} WHERE {column} = ?', (key,))
+
+    def _insert_bill(self, bill_data, actions, votes, content_hash):
+        key = bill_data['key']
+        self.connection.execute(
+            'INSERT INTO bills VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (key, bill_data.get('session'), bill_data.get('title'), bill_data.get('sponsor'),
+             bill_data.get('sponsorParty'), bill_data.get('sponsorDistrict'),
+             bill_data.get('billStatus'), iso_date(bill_data.get('statusDate')),
+             bill_data.get('lastAction'), content_hash, json.dumps(bill_data)))
+        self.connection.executemany(
+            'INSERT INTO actions VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            [(action['id'], key, position, action['action'], iso_date(action['date']),
+              action['committee'], int(action['hasVote']), json.dumps(action))
+             for position, action in enumerate(actions)])
+        for vote in votes:
+            totals = vote.get('totals') or {}
+            summary = {field: ([] if field == 'votes' else value) for field, value in vote.items()}
+            self.connection.execute(
+                'INSERT INTO votes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (vote['action_id'], key, vote['type'], iso_date(vote.get('date')),
+                 vote.get('description'), totals.get('Y'), totals.get('N'),
+                 vote.get('error'), json.dumps(summary)))
+            self.connection.executemany(
+                'INSERT INTO vote_records VALUES (?, ?, ?, ?, ?)',
+                [(vote['action_id'], key, position, record['name'], record['vote'])
+                 for position, record in enumerate(vote.get('votes', []))])
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+        print(f'Output database: {self.updated} bills updated ({self.path})')
+
+    # Query API
+
+    def _query(self, sql, params=()):
+        with self.lock:
+            return self.connection.execute(sql, params).fetchall()
+
+    def bill(self, key):
+        rows = self._query('SELECT data FROM bills WHERE key = ?', (key,))
+        return json.loads(rows[0]['data']) if rows else None
+
+    def bills(self, sponsor=None, status=None):
+        """
+        Returns bill data, optionally filtered to a sponsor and/or status, in key order
+        """
+        clauses, params = [], []
+        if sponsor is not None:
+            clauses.append('sponsor = ?')
+            params.append(sponsor)
+        if status is not None:
+            clauses.append('status = ?')
+            params.append(status)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        return [json.loads(row['data'])
+                for row in self._query(f'SELECT data FROM bills {where} ORDER BY key', params)]
+
+    def bill_actions(self, key):
+        return [json.loads(row['data']) for row in self._query(
+            'SELECT data FROM actions WHERE bill = ? ORDER BY position', (key,))]
+
+    def actions(self, committee=None, since=None, until=None):
+        """
+        Returns actions, optionally filtered to a committee and an inclusive YYYY-MM-DD date range
+        """
+        clauses, params = [], []
+        if committee is not None:
+            clauses.append('committee = ?')
+            params.append(committee)
+        if since is not None:
+            clauses.append('date >= ?')
+            params.append(since)
+        if until is not None:
+            clauses.append('date <= ?')
+            params.append(until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        return [json.loads(row['data']) for row in self._query(
+            f'SELECT data FROM actions {where} ORDER BY date, bill, position', params)]
+
+    def vote(self, action_id):
+        """
+        Returns a vote as exported, name-by-name votes included
+        """
+        rows = self._query('SELECT data FROM votes WHERE action_id = ?', (action_id,))
+        if not rows:
+            return None
+        vote = json.loads(rows[0]['data'])
+        if 'votes' not in vote:
+            return vote
+        vote['votes'] = [{'name': row['name'], 'vote': row['vote']} for row in self._query(
+            'SELECT name, vote FROM vote_records WHERE action_id = ? ORDER BY position', (action_id,))]
+        return vote
+
+    def bill_votes(self, key):
+        return [self.vote(row['action_id']) for row in self._query(
+            'SELECT action_id FROM votes WHERE bill = ? ORDER BY action_id', (key,))]
+
+    def lawmaker_votes(self, name):
+        """
+        Returns every recorded vote by a lawmaker, by name as it appears on vote sheets, in date order
+        """
+        return [dict(row) for row in self._query('''
+            SELECT r.action_id AS actionId, r.bill, v.type, v.date, v.description, r.vote
+            FROM vote_records r JOIN votes v ON v.action_id = r.action_id
+            WHERE r.name = ?
+            ORDER BY v.date, r.action_id''', (name,))]
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import sqlite3
+from threading import Lock
+
+from instrumentation import STATS
+
+# New entries are buffered in memory and written in one transaction once this many pile up
+FLUSH_EVERY = 250
+
+
+class ParseCache:
+    """
+    Content-addressed cache of parser output, stored in SQLite
+
+    Entries are keyed by parser name plus a sha256 of the source document (bill page HTML,
+    floor vote HTML, committee vote PDF), and tagged with the parser's version. Bumping a
+    parser's version constant invalidates that parser's entries only; stale rows are dropped
+    the first time the parser is used.
+
+    New entries are written in short batched transactions, so several processes can share
+    the same cache file (see BillList rebuild_from_cache).
+
+    Parsed values must be JSON-serializable.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(
+            path, timeout=60, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS parsed (
+                parser TEXT NOT NULL,
+                source_hash TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (parser, source_hash)
+            )''')
+        self.connection.commit()
+        self.lock = Lock()
+        self.pruned = set()
+        self.pending = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_parse(self, parser, version, source, parse):
+        """
+        Returns cached output of `parse()` for source bytes, running and caching it on a miss
+        """
+        source_hash = hashlib.sha256(source).hexdigest()
+        with self.lock:
+            if parser not in self.pruned:
+                with self.connection:
+                    self.connection.execute(
+                        'DELETE FROM parsed WHERE parser = ? AND version != ?', (parser, version))
+                self.pruned.add(parser)
+            cached = self.pending.get((parser, source_hash, version))
+            if cached is None:
+                row = self.connection.execute(
+                    'SELECT data FROM parsed WHERE parser = ? AND source_hash = ? AND version = ?',
+                    (parser, source_hash, version)).fetchone()
+                cached = row[0] if row else None
+            if cached is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        STATS.count(f'parseCache.{parser}.{"hits" if cached is not None else "misses"}')
+        if cached is not None:
+            return json.loads(cached)
+
+        parsed = parse()
+        with self.lock:
+            self.pending[(parser, source_hash, version)] = json.dumps(parsed)
+            if len(self.pending) >= FLUSH_EVERY:
+                self._flush()
+        return parsed
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if self.pending:
+            with self.connection:
+                self.connection.executemany(
+                    'INSERT OR REPLACE INTO parsed VALUES (?, ?, ?, ?)',
+                    [(parser, source_hash, version, data)
+                     for (parser, source_hash, version), data in self.pending.items()])
+            self.pending = {}
+
+    def save(self):
+        self.flush()
+        print(f'Parse cache: {self.hits} hits, {self.misses} misses ({self.path})')
@@ -0,0 +1,15 @@
+# Dry run - lists which bills the next scrape would fetch and why, without fetching them
+# Run as `python3 plan-refresh.py` (add `--cached` to plan against the cached bill list)
+import sys
+
+from config import BILL_LIST_URL
+
+from models.bill_list import BillList
+
+bill_list = BillList(
+    force_refresh=False,
+    bill_list_url=BILL_LIST_URL,
+    use_html_bill_list_cache='--cached' in sys.argv,
+    dry_run=True
+)
+bill_list.print_refresh_plan()
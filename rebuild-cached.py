@@ -0,0 +1,20 @@
+# Rebuilds a session's output from cached bill pages and votes across a process pool, without fetching
+# Use after parser changes. Run as `python3 rebuild-cached.py [session] [processes]`, e.g. `python3 rebuild-cached.py 20211 8`
+import os
+import sys
+
+if len(sys.argv) > 1:
+    os.environ['LAWS_SESSION_ID'] = sys.argv[1]
+processes = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+
+from config import BILL_LIST_URL
+
+from models.bill_list import BillList
+
+bill_list = BillList(
+    bill_list_url=BILL_LIST_URL,
+    rebuild_from_cache=True,
+    processes=processes,
+    use_verbose_logging=False
+)
+bill_list.export()
@@ -1,5 +1,9 @@
 
-from config import BILL_LIST_URL
+# Add `--streaming` to build and export bills one at a time, for a flat memory profile
+# Add `--budget SECONDS` to refresh bills highest priority first for that long, leaving the rest for the next run
+import sys
+
+from config import BILL_LIST_URL, SCRAPE_TIME_BUDGET_SECONDS
 
 from models.bill_list import BillList
 
@@ -7,6 +11,8 @@ from models.bill_list import BillList
 bill_list = BillList(
     force_refresh=False,
     bill_list_url=BILL_LIST_URL,
-    use_verbose_logging=True
+    use_verbose_logging=True,
+    streaming='--streaming' in sys.argv,
+    time_budget=float(sys.argv[sys.argv.index('--budget') + 1]) if '--budget' in sys.argv else SCRAPE_TIME_BUDGET_SECONDS
 )
 bill_list.export()
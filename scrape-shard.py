@@ -0,0 +1,25 @@
+# Scrapes one shard of the current session's bill list, for a sharded scrape (see sharding.py)
+# Run as `python3 scrape-shard.py INDEX COUNT`, once per shard, e.g. side by side on one machine:
+#   for i in 0 1 2 3; do python3 scrape-shard.py $i 4 & done; wait; python3 merge-shards.py 4
+# Add `--full` to force a refresh of every bill in the shard, like scrape-full.py
+# Add `--streaming` and `--budget SECONDS` as for scrape-full.py and scrape-cached.py
+import sys
+
+from config import BILL_LIST_URL, SCRAPE_TIME_BUDGET_SECONDS
+
+from models.bill_list import BillList
+from sharding import Shard
+
+shard = Shard(int(sys.argv[1]), int(sys.argv[2]))
+
+# Run scrape, leaving combined files, vote matrix, database and change feed to the merge
+bill_list = BillList(
+    force_refresh='--full' in sys.argv,
+    bill_list_url=BILL_LIST_URL,
+    use_verbose_logging=True,
+    streaming='--streaming' in sys.argv,
+    time_budget=float(sys.argv[sys.argv.index('--budget') + 1]) if '--budget' in sys.argv else SCRAPE_TIME_BUDGET_SECONDS,
+    shard=shard
+)
+bill_list.export(formats=[], write_database=False, write_vote_matrix=False, write_change_feed=False,
+                 run_report_path=shard.run_report_path, names_report_path=None)
@@ -0,0 +1,166 @@
+"""
+Sharded scrapes, with the bill list split across workers and merged back into one session's output
+
+Each bill belongs to one of N shards by a stable hash of its key (see shard_of), so the split
+doesn't depend on list order or on which machine runs it. A shard (scrape-shard.py, or
+BillList(shard=...)) builds only its own bills, writing their cache and per-bill output files
+where a whole scrape would, since no two shards touch the same ones. Scrape state every bill
+shares is saved to the shard's fragment directory instead, e.g. cache/20231/shards/1-of-4/:
+- last-scrape-bill-data.json, refresh-manifest.json, missing-votes.json - the shard's copies
+- bill-list.json - every key on the bill list in list order, the shard's or not
+- response-meta.json - response metadata indexes the shard changed, see HttpClient.save
+- run-report.json - the shard's run report
+
+merge_shards (merge-shards.py) then puts the shards' bills back in bill list order to write
+last-scrape-bill-data.json and the combined exports, the same files a single scrape would,
+folds each shard's state changes into the shared files and removes the fragments.
+
+Shards can run side by side on one machine, or on separate runners as long as their changed
+cache, output and fragment files are all copied into one checkout before merging. Needs the
+'directory' cache store backend. Only shard 0 rewrites the bill list page cache.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+from os.path import basename, exists, join
+
+from config import SESSION_ID, CACHE_BASE_PATH, OUTPUT_BASE_PATH, CACHE_STORE_BACKEND
+
+from fetch import HttpClient
+from functions import make_bill_key, merge_changes, read_json, write_json
+from instrumentation import STATS
+from models.bill_list import BillList, BILL_DATA_CACHE, REFRESH_MANIFEST_PATH, MISSING_VOTES_PATH, RUN_REPORT_PATH
+
+log = logging.getLogger(__name__)
+
+SHARDS_PATH = join(CACHE_BASE_PATH, 'shards')
+
+
+def shard_of(key, count):
+    """
+    Shard index of a bill key, e.g. 'HB 1', out of `count`. Same everywhere, unlike hash()
+    """
+    digest = hashlib.sha256(key.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % count
+
+
+class Shard:
+    """
+    One of `count` slices of the session's bill list, see module docstring
+
+    - path - fragment directory, e.g. cache/20231/shards/1-of-4
+    """
+
+    def __init__(self, index, count):
+        if not 0 <= index < count:
+            raise ValueError(f'Shard index {index} out of range for {count} shards')
+        if CACHE_STORE_BACKEND != 'directory':
+            raise ValueError('Sharded scrapes need the directory cache store backend')
+        self.index = index
+        self.count = count
+        self.name = f'{index}-of-{count}'
+        self.path = join(SHARDS_PATH, self.name)
+        self.bill_list_path = join(self.path, 'bill-list.json')
+        self.response_meta_path = join(self.path, 'response-meta.json')
+        self.run_report_path = self.path_for(RUN_REPORT_PATH)
+
+    def clear_fragments(self):
+        # Fragments from an earlier run of the shard would otherwise get merged with this one's
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.makedirs(self.path)
+
+    def includes(self, key):
+        return shard_of(key, self.count) == self.index
+
+    def path_for(self, path):
+        # The shard's copy of a shared scrape state file
+        return join(self.path, basename(path))
+
+
+class ShardOutputBill:
+    """
+    A bill as its shard exported it, read back from the per-bill output files for BillList.export
+    """
+
+    def __init__(self, key, output_base_path=OUTPUT_BASE_PATH):
+        self.key = key
+        self.urlKey = make_bill_key(key)
+        self.output_base_path = output_base_path
+
+    def read(self, suffix):
+        with open(join(self.output_base_path, f'{self.urlKey}--{suffix}.json')) as f:
+            return json.load(f)
+
+    def export(self):
+        return self.read('data')
+
+    def export_actions(self):
+        return self.read('actions')
+
+    def export_votes(self):
+        return self.read('votes')
+
+
+def merge_order(listed_keys):
+    """
+    Bill list order to merge in. Shards normally all see the same list; if it changed between
+    their fetches, keys missing from shard 0's list go after it, in the order later shards saw them
+    """
+    if any(keys != listed_keys[0] for keys in listed_keys[1:]):
+        log.warning('Shards saw different bill lists, merging in shard 0 order')
+    order = list(listed_keys[0])
+    seen = set(order)
+    for keys in listed_keys[1:]:
+        for key in keys:
+            if key not in seen:
+                seen.add(key)
+                order.append(key)
+    return order
+
+
+def merge_shards(count, remove_fragments=True):
+    """
+    Merges a finished `count`-shard scrape into the session's shared scrape state and combined
+    exports, see module docstring. Raises ValueError if any shard's fragments are missing
+    """
+    shards = [Shard(index, count) for index in range(count)]
+    missing = [shard.name for shard in shards if not exists(shard.bill_list_path)]
+    if missing:
+        raise ValueError(f"No finished scrape for shard(s) {', '.join(missing)}")
+
+    # Each shard only has its own bills' data, so put them together in list order
+    order = merge_order([read_json(shard.bill_list_path) for shard in shards])
+    bill_data = {}
+    for shard in shards:
+        for data in read_json(shard.path_for(BILL_DATA_CACHE)):
+            bill_data[data['key']] = data
+    merged_data = [bill_data[key] for key in order if key in bill_data]
+    print(f'Merging {len(merged_data)} bills from {count} shards')
+    write_json(merged_data, BILL_DATA_CACHE)
+
+    # Every shard started from the same shared state, so each shard's changes are what it
+    # saved that differs from the shared file
+    for path in [REFRESH_MANIFEST_PATH, MISSING_VOTES_PATH]:
+        fragments = [read_json(shard.path_for(path)) for shard in shards if exists(shard.path_for(path))]
+        if fragments:
+            original = read_json(path) if exists(path) else {}
+            merged = merge_changes(original, fragments)
+            write_json({key: merged[key] for key in sorted(merged)}, path)
+    client = HttpClient()
+    client.merge_fragments([shard.response_meta_path for shard in shards if exists(shard.response_meta_path)])
+    client.save()
+
+    # Combined files, vote matrix and database come out of the same export a single scrape runs
+    STATS.reset()
+    bill_list = BillList.__new__(BillList)
+    bill_list.options = {'shards': count}
+    bill_list.bills = (ShardOutputBill(data['key']) for data in merged_data)
+    bill_list.export(run_report_path=None)
+    shard_reports = [read_json(shard.run_report_path) for shard in shards if exists(shard.run_report_path)]
+    STATS.save(RUN_REPORT_PATH, session=SESSION_ID, options=bill_list.options, shards=shard_reports)
+
+    if remove_fragments:
+        shutil.rmtree(SHARDS_PATH)
+    return merged_data
@@ -6,9 +6,12 @@
 import json
 
 from functions import read_json
+from instrumentation import configure_logging
 
 from models.bill import Bill
 
+configure_logging(verbose=True)
+
 raw_bills = read_json('output/20231/all-bills.json')
 bill_id = 'SB 73'
 # bill_id = 'HB 1'
@@ -3,6 +3,9 @@
 
 import json
 from models.vote import Vote
+from instrumentation import configure_logging
+
+configure_logging(verbose=True)
 
 vote = Vote(
     # {
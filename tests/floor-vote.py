@@ -2,6 +2,9 @@
 # Run as `python3 -m tests.floor-vote`
 import json
 from models.vote import Vote
+from instrumentation import configure_logging
+
+configure_logging(verbose=True)
 
 vote = Vote({
     "url": "http://laws.leg.mt.gov/legprd/LAW0211W$BLAC.VoteTabulation?P_VOTE_SEQ=S204&P_SESS=20211",
@@ -0,0 +1,65 @@
+# Checks that the bs4 and lxml parser backends produce identical data for every cached
+# bill page and floor vote page in the current session's cache, and for its bill list
+# Run as `python3 -m tests.parser-equivalence` (set LAWS_SESSION_ID=20211 for the 2021 cache)
+
+import sys
+import time
+from os.path import join
+
+from config import CACHE_BASE_PATH
+
+from cache_store import get_cache_store
+
+from models.bill import Bill
+from models.bill_list import BillList
+from models.vote import Vote
+
+
+def compare(label, paths, bs4_parse, lxml_parse):
+    mismatches = []
+    bs4_time = 0
+    lxml_time = 0
+    for path in paths:
+        text = store.read_text(path)
+        if "No Vote Records Found for this Action." in text:
+            continue
+        start = time.perf_counter()
+        expected = bs4_parse(text)
+        bs4_time += time.perf_counter() - start
+        start = time.perf_counter()
+        actual = lxml_parse(text)
+        lxml_time += time.perf_counter() - start
+        if actual != expected:
+            mismatches.append(path)
+            print('Mismatch:', path)
+    print(f'## {label}: {len(paths)} files, {len(mismatches)} mismatches '
+          f'(bs4 {bs4_time:.1f}s, lxml {lxml_time:.1f}s)')
+    return mismatches
+
+
+# Bill pages are cached as e.g. 'HB 12.html', 2021 cache also has some stray vote pages in bills/
+store = get_cache_store(CACHE_BASE_PATH)
+bill_paths = [key for key in store.keys('bills', '.html') if ' ' in key]
+floor_vote_paths = store.keys('votes', '.html')
+
+mismatches = compare('Bill pages', bill_paths,
+                     Bill.parse_bill_html, Bill.parse_bill_html_lxml)
+mismatches += compare('Floor votes', floor_vote_paths,
+                      Vote.parse_floor_vote_html, Vote.parse_floor_vote_html_lxml)
+
+# Bill list is parsed as it streams in, so it's also checked fed through in small chunks
+with open(join(CACHE_BASE_PATH, 'all-introduced-bills.html')) as f:
+    bill_list_text = f.read()
+bill_list = BillList.__new__(BillList)
+expected = bill_list.parse_bill_list_html(bill_list_text)
+bill_list_mismatches = []
+for chunk_size in [len(bill_list_text), 1000]:
+    chunks = (bill_list_text[i:i + chunk_size] for i in range(0, len(bill_list_text), chunk_size))
+    if list(bill_list.parse_bill_list_stream(chunks)) != expected:
+        bill_list_mismatches.append(f'bill list in {chunk_size} character chunks')
+        print('Mismatch:', bill_list_mismatches[-1])
+print(f'## Bill list: {len(expected)} rows, {len(bill_list_mismatches)} mismatches')
+mismatches += bill_list_mismatches
+
+if mismatches:
+    sys.exit(1)
@@ -0,0 +1,53 @@
+# Checks that bills whose refresh a time budget deferred are planned the same on the next scrape,
+# with and without refresh manifest entries, from the bill data a budgeted scrape saves
+# Run as `python3 -m tests.time-budget`
+
+import sys
+import tempfile
+from datetime import datetime
+from os.path import join
+
+from models.bill_list import next_scrape_bill_data
+from models.refresh_manifest import RefreshManifest
+
+
+class PlannedBill:
+    # Stands in for a built Bill, whose bill data has the new bill list row in it
+    def __init__(self, raw):
+        self.key = raw['key']
+        self.raw = raw
+
+    def export(self):
+        return self.raw
+
+
+now = datetime(2023, 3, 1, 12)
+last = {'key': 'HB 1', 'statusDate': '02/20/2023', 'lastAction': '(H) Committee Executive Action--Bill Passed'}
+row = {'key': 'HB 1', 'statusDate': '02/27/2023', 'lastAction': '(H) 2nd Reading Passed'}
+new_row = {'key': 'HB 2', 'statusDate': '02/27/2023', 'lastAction': '(H) Introduced'}
+
+failures = []
+with tempfile.TemporaryDirectory() as directory:
+    for case, with_entries in [('no manifest entries', False), ('manifest entries', True)]:
+        path = join(directory, f'{case}.json')
+        manifest = RefreshManifest(path, last_scrape_bills=[last], now=now)
+        if with_entries:
+            manifest.record(last, fetched=True)
+        manifest.save(path)
+
+        manifest = RefreshManifest(path, last_scrape_bills=[last], now=now)
+        before = [manifest.plan_bill(raw) for raw in [row, new_row]]
+        # Both deferred, so neither is recorded in the manifest
+        bill_data = next_scrape_bill_data([PlannedBill(row), PlannedBill(new_row)], {'HB 1', 'HB 2'},
+                                          manifest.last_scrape_bills)
+        manifest = RefreshManifest(path, last_scrape_bills=bill_data, now=now)
+        after = [manifest.plan_bill(raw) for raw in [row, new_row]]
+
+        for planned, replanned in zip(before, after):
+            print(f"{case}, {planned['key']}: {planned['reason']} (priority {planned['priority']})"
+                  f" -> {replanned['reason']} (priority {replanned['priority']})")
+            if not replanned['needsRefresh'] or replanned['priority'] != planned['priority']:
+                failures.append(f"{case}, {planned['key']}")
+
+print('\n' + (f'{len(failures)} deferred bills not replanned: {failures}' if failures else 'Deferred bills replanned'))
+sys.exit(1 if failures else 0)
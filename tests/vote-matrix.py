@@ -0,0 +1,50 @@
+# Checks that the exported vote matrix holds the same name-by-name votes as all-votes.json
+# for the current session's output, and times loading it
+# Run as `python3 -m tests.vote-matrix` after an export (set LAWS_SESSION_ID=20211 for 2021 output)
+
+import json
+import sys
+import time
+from os.path import join
+
+from config import OUTPUT_BASE_PATH
+
+from models.bill_list import LAWMAKERS_FILENAME, VOTE_MATRIX_FILENAME
+from vote_matrix import VoteMatrix
+
+start = time.perf_counter()
+matrix = VoteMatrix.load(join(OUTPUT_BASE_PATH, VOTE_MATRIX_FILENAME))
+load_time = time.perf_counter() - start
+
+with open(join(OUTPUT_BASE_PATH, 'all-votes.json')) as f:
+    votes = [vote for vote in json.load(f) if vote.get('votes')]
+with open(join(OUTPUT_BASE_PATH, LAWMAKERS_FILENAME)) as f:
+    lawmakers = json.load(f)
+# Names as printed map to the lawmaker they resolved to. Aliases can repeat across
+# chambers, but always to the same lawmaker unless the resolver disagrees with itself
+canonical = {}
+for lawmaker in lawmakers:
+    for name in [lawmaker['name']] + lawmaker['aliases']:
+        canonical[name] = lawmaker['name']
+
+codes = matrix.columns['codes']
+names = matrix.columns['lawmaker_name']
+mismatches = []
+if list(matrix.columns['action_id']) != [vote['action_id'] for vote in votes]:
+    mismatches.append('vote order')
+for row, vote in zip(matrix.votes, votes):
+    expected = {canonical[record['name']]: record['vote'] for record in vote['votes']}
+    actual = {names[i]: codes[code] for i, code in enumerate(row) if code}
+    if actual != expected:
+        mismatches.append(vote['action_id'])
+        print('Mismatch:', vote['action_id'])
+
+start = time.perf_counter()
+matrix.agreement()
+agreement_time = time.perf_counter() - start
+
+print(f'## Vote matrix: {matrix.votes.shape[0]} votes x {matrix.votes.shape[1]} lawmakers, '
+      f'{len(mismatches)} mismatches (load {load_time * 1000:.1f}ms, pairwise agreement {agreement_time * 1000:.1f}ms)')
+
+if mismatches:
+    sys.exit(1)
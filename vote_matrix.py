@@ -0,0 +1,169 @@
+"""
+Columnar roll-call vote export, e.g. output/20231/vote-matrix.npz
+
+One int8 row per vote with name-by-name records and one column per lawmaker ID (see
+models/lawmaker.py), coded with VOTE_CODES, plus per-vote and per-lawmaker metadata columns.
+Loads without JSON parsing or name joins, so session-wide analyses are plain array operations:
+
+    matrix = VoteMatrix.load('output/20231/vote-matrix.npz')
+    matrix.agreement()[matrix.lawmaker_id('Bishop, Laurie')]
+"""
+import io
+import logging
+import zipfile
+from array import array
+
+import numpy as np
+
+from functions import write_if_changed, write_json
+from models.lawmaker import LawmakerRoster
+from output_store import iso_date
+
+log = logging.getLogger(__name__)
+
+# Matrix codes, by index. 0 is no record, i.e. the lawmaker wasn't on the vote's chamber or committee
+VOTE_CODES = ['', 'Y', 'N', 'E', 'A']
+CODE_BY_VOTE = {vote: code for code, vote in enumerate(VOTE_CODES) if vote}
+
+# Fixed archive member timestamps, so an unchanged matrix writes identical bytes
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+
+class VoteMatrixWriter:
+    """
+    Collects name-by-name votes as export goes, then writes the vote matrix and lawmaker roster on close
+
+    Arrays in the .npz:
+    - votes - int8, votes × lawmakers
+    - action_id, bill, type, seq_number, description - per vote strings, '' where missing
+    - date - per vote datetime64[D], NaT where it doesn't parse
+    - yeas, nays - per vote totals as reported on the vote page, -1 where missing
+    - lawmaker_name, lawmaker_chamber, lawmaker_vote_count - per lawmaker, indexed by ID
+    - codes - VOTE_CODES
+
+    Records are held as flat arrays until close, since names are only resolved to lawmakers
+    once every vote is in, see LawmakerRoster. The resolver's report of names that needed
+    fuzzy matching or didn't resolve is written to names_report_path, if there is one
+    """
+
+    def __init__(self, path, roster_path=None, names_report_path=None):
+        self.path = path
+        self.roster_path = roster_path
+        self.names_report_path = names_report_path
+        self.roster = LawmakerRoster()
+        self.columns = {name: [] for name in ['action_id', 'bill', 'type', 'seq_number', 'date',
+                                              'description', 'yeas', 'nays']}
+        self.record_rows = array('i')
+        self.record_names = array('i')
+        self.record_codes = array('b')
+
+    def extend(self, votes):
+        for vote in votes:
+            records = vote.get('votes')
+            if not records:
+                continue
+            row = len(self.columns['action_id'])
+            totals = vote.get('totals') or {}
+            for name, value in [('action_id', vote['action_id']), ('bill', vote['bill']),
+                                ('type', vote['type']), ('seq_number', vote.get('seq_number') or ''),
+                                ('date', iso_date(vote.get('date')) or 'NaT'),
+                                ('description', vote.get('description') or ''),
+                                ('yeas', totals.get('Y', -1)), ('nays', totals.get('N', -1))]:
+                self.columns[name].append(value)
+            for record in records:
+                self.record_rows.append(row)
+                self.record_names.append(self.roster.add(record['name'], vote))
+                self.record_codes.append(CODE_BY_VOTE[record['vote']])
+
+    def arrays(self):
+        lawmakers = self.roster.finalize()
+        votes = np.zeros((len(self.columns['action_id']), len(lawmakers)), dtype=np.int8)
+        lawmaker_ids = np.array(self.roster.ids, dtype=np.int32)[
+            np.frombuffer(self.record_names, dtype=np.int32)]
+        votes[np.frombuffer(self.record_rows, dtype=np.int32), lawmaker_ids] = \
+            np.frombuffer(self.record_codes, dtype=np.int8)
+        return {
+            'votes': votes,
+            'action_id': np.array(self.columns['action_id'], dtype=str),
+            'bill': np.array(self.columns['bill'], dtype=str),
+            'type': np.array(self.columns['type'], dtype=str),
+            'seq_number': np.array(self.columns['seq_number'], dtype=str),
+            'date': np.array(self.columns['date'], dtype='datetime64[D]'),
+            'description': np.array(self.columns['description'], dtype=str),
+            'yeas': np.array(self.columns['yeas'], dtype=np.int16),
+            'nays': np.array(self.columns['nays'], dtype=np.int16),
+            'lawmaker_name': np.array([lawmaker.name for lawmaker in lawmakers], dtype=str),
+            'lawmaker_chamber': np.array([lawmaker.chamber or '' for lawmaker in lawmakers], dtype=str),
+            'lawmaker_vote_count': np.array([lawmaker.vote_count for lawmaker in lawmakers], dtype=np.int32),
+            'codes': np.array(VOTE_CODES, dtype=str),
+        }
+
+    def close(self):
+        """
+        Writes the matrix, plus roster and name report JSON if they have paths. Returns whether the matrix changed
+        """
+        buffer = io.BytesIO()
+        # Same layout as np.savez_compressed, minus its current-time member timestamps
+        with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for name, values in self.arrays().items():
+                member = zipfile.ZipInfo(f'{name}.npy', date_time=ZIP_DATE_TIME)
+                member.compress_type = zipfile.ZIP_DEFLATED
+                with archive.open(member, 'w') as f:
+                    np.lib.format.write_array(f, values, allow_pickle=False)
+        changed = write_if_changed(buffer.getvalue(), self.path)
+        print('Written to' if changed else 'Unchanged', self.path)
+        if self.roster_path:
+            write_json(self.roster.export(), self.roster_path)
+        report = self.roster.resolver.report()
+        if report['unresolved']:
+            log.warning('%d lawmaker names on %d vote records could not be resolved to floor vote names',
+                        len(report['unresolved']), sum(name['occurrences'] for name in report['unresolved']))
+        if self.names_report_path:
+            write_json(report, self.names_report_path)
+        return changed
+
+
+class VoteMatrix:
+    """
+    Loaded vote matrix, see VoteMatrixWriter for what's in it
+
+    - votes - int8 votes × lawmakers array
+    - columns - every array in the file by name, votes included
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.votes = columns['votes']
+        self.lawmaker_ids = {name: i for i, name in enumerate(columns['lawmaker_name'])}
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls({name: data[name] for name in data.files})
+
+    def lawmaker_id(self, name):
+        return self.lawmaker_ids[name]
+
+    def agreement(self):
+        """
+        Returns a lawmakers × lawmakers array of how often each pair voted the same way, out of
+        the Y/N votes they were both recorded on (NaN for pairs that share none)
+        """
+        yeas = (self.votes == CODE_BY_VOTE['Y']).astype(np.float32)
+        nays = (self.votes == CODE_BY_VOTE['N']).astype(np.float32)
+        either = yeas + nays
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (yeas.T @ yeas + nays.T @ nays) / (either.T @ either)
+
+    def with_majority(self):
+        """
+        Returns each lawmaker's share of Y/N votes cast with the majority of that vote, ties
+        excluded (NaN for lawmakers with none)
+        """
+        yeas = self.votes == CODE_BY_VOTE['Y']
+        nays = self.votes == CODE_BY_VOTE['N']
+        margin = np.sign(yeas.sum(axis=1, dtype=np.int32) - nays.sum(axis=1, dtype=np.int32))[:, None]
+        with_majority = (yeas & (margin > 0)) | (nays & (margin < 0))
+        counted = (yeas | nays) & (margin != 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return with_majority.sum(axis=0) / counted.sum(axis=0)
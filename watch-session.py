@@ -0,0 +1,75 @@
+# Keeps the current session's scrape resident and up to date, instead of a cold run per cron job
+# Builds and exports every bill once, then checks the bill list every WATCH_INTERVAL_SECONDS and
+# only rebuilds and re-exports bills that moved (see BillList.refresh). Parsed bills, actions and
+# votes stay in memory between checks, so an update takes seconds rather than a full scrape.
+# Run as `python3 watch-session.py`, or e.g. `python3 watch-session.py --interval 60 --verbose`
+# Stops after the update in progress on Ctrl-C or SIGTERM
+import argparse
+import logging
+import signal
+import threading
+import time
+
+from config import BILL_LIST_URL, WATCH_INTERVAL_SECONDS
+
+from fetch import FetchScheduler
+from instrumentation import STATS
+from models.bill_list import BillList
+
+log = logging.getLogger('watch-session')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Keep the session scrape up to date from a resident process')
+    parser.add_argument('--interval', type=float, default=WATCH_INTERVAL_SECONDS,
+                        help='seconds between bill list checks')
+    parser.add_argument('--updates', type=int, default=None,
+                        help='stop after this many checks, rather than running until stopped')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    stopping = threading.Event()
+    for signum in [signal.SIGINT, signal.SIGTERM]:
+        signal.signal(signum, lambda *_: stopping.set())
+
+    # Kept open between updates, BillList would close a scheduler of its own after the first build
+    scheduler = FetchScheduler()
+    try:
+        watch(args, scheduler, stopping)
+    finally:
+        scheduler.close()
+
+
+def watch(args, scheduler, stopping):
+    start = time.perf_counter()
+    bill_list = BillList(BILL_LIST_URL, use_verbose_logging=args.verbose, scheduler=scheduler)
+    bill_list.export()
+    log.info('Watching %d bills, first scrape took %.1fs', len(bill_list.bills), time.perf_counter() - start)
+
+    exported_keys = [bill.key for bill in bill_list.bills]
+    unexported = set()  # Rebuilt bills whose export hasn't gone through yet
+    updates = 0
+    while not stopping.wait(args.interval):
+        STATS.reset()
+        start = time.perf_counter()
+        try:
+            rebuilt = bill_list.refresh(BILL_LIST_URL)
+            unexported.update(rebuilt)
+            keys = [bill.key for bill in bill_list.bills]
+            if unexported or keys != exported_keys:
+                bill_list.export(only_keys=unexported)
+                exported_keys = keys
+                unexported = set()
+        except Exception:
+            # Bills keep their last built state, and go out with the next update that works
+            log.exception('Update failed, trying again in %ss', args.interval)
+        else:
+            log.info('Rebuilt %d of %d bills in %.1fs', len(rebuilt), len(bill_list.bills),
+                     time.perf_counter() - start)
+        updates += 1
+        if args.updates is not None and updates >= args.updates:
+            break
+
+
+if __name__ == '__main__':
+    main()